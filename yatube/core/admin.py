@@ -0,0 +1,19 @@
+from django.contrib import admin
+
+from .models import OutboxMessage
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    """Очередь писем в админке"""
+    list_display = (
+        'pk',
+        'subject',
+        'recipients',
+        'created',
+        'attempts',
+        'sent',
+    )
+    list_filter = ('sent',)
+    exclude = ('message',)
+    readonly_fields = ('last_error',)
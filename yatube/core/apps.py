@@ -1,5 +1,19 @@
+import logging
+
 from django.apps import AppConfig
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from . import checks
+
+        if settings.TEMPLATES_CACHED:
+            # Проверка core.E001 видна только в check и runserver, а
+            # процесс сервера без этого лога молча пропустил бы шаблон
+            for name, error in checks.compile_templates().items():
+                logger.error('Шаблон %s не компилируется: %s', name, error)
@@ -0,0 +1,43 @@
+import os
+
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+from django.template import TemplateSyntaxError
+from django.template.loader import get_template
+
+
+def project_template_names():
+    """Имена всех шаблонов проекта из TEMPLATES_DIR."""
+    for root, _, files in os.walk(settings.TEMPLATES_DIR):
+        for filename in sorted(files):
+            if filename.endswith('.html'):
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, settings.TEMPLATES_DIR)
+                yield name.replace(os.sep, '/')
+
+
+def compile_templates():
+    """Компилирует шаблоны проекта, возвращает ошибки синтаксиса.
+
+    С кэширующим загрузчиком скомпилированные шаблоны остаются в памяти
+    процесса, поэтому первые запросы не платят за разбор.
+    """
+    errors = {}
+    for name in project_template_names():
+        try:
+            get_template(name)
+        except TemplateSyntaxError as error:
+            errors[name] = error
+
+    return errors
+
+
+@register(Tags.templates)
+def check_templates_compile(app_configs, **kwargs):
+    return [
+        Error(
+            f'Шаблон {name} не компилируется: {error}',
+            id='core.E001',
+        )
+        for name, error in compile_templates().items()
+    ]
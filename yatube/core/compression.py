@@ -0,0 +1,67 @@
+import gzip
+import hashlib
+import secrets
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .storage import brotli
+
+COMPRESSIBLE_TYPES = (
+    'text/', 'application/json', 'application/javascript',
+    'application/xml', 'image/svg+xml',
+)
+
+
+def supported_encodings():
+    """Кодировки ответов в порядке предпочтения сервера."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def gzip_bytes(content, compresslevel=6):
+    """gzip без даты в заголовке: одинаковое тело сжимается одинаково.
+
+    gzip.compress принимает mtime только с Python 3.8.
+    """
+    buffer = BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb',
+                       compresslevel=compresslevel, mtime=0) as file:
+        file.write(content)
+
+    return buffer.getvalue()
+
+
+def compress_body(content, encoding, max_random_bytes=0):
+    """Сжимает тело ответа.
+
+    max_random_bytes добавляет в заголовок gzip имя файла случайной длины
+    (приём Heal The Breach): длина ответа перестаёт выдавать совпадения
+    секрета с данными, которые подставил атакующий.
+    """
+    if encoding == 'br':
+        return brotli.compress(content, quality=5)
+    compressed = gzip_bytes(content)
+    if not max_random_bytes:
+        return compressed
+    header = bytearray(compressed[:10])
+    header[3] |= gzip.FNAME
+    filename = b'a' * secrets.randbelow(max_random_bytes) + b'\x00'
+
+    return bytes(header) + filename + compressed[10:]
+
+
+def cached_compress(content, encoding):
+    """Сжатое тело из кэша по хэшу содержимого.
+
+    Одинаковые ответы (например, страница из cache_page) сжимаются один
+    раз на кодировку, а не при каждом запросе.
+    """
+    digest = hashlib.sha1(content).hexdigest()
+    key = f'compressed:{encoding}:{digest}'
+    compressed = cache.get(key)
+    if compressed is None:
+        compressed = compress_body(content, encoding)
+        cache.set(key, compressed, settings.COMPRESSION_CACHE_TIMEOUT)
+
+    return compressed
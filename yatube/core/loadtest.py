@@ -0,0 +1,170 @@
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+
+import requests
+
+DEFAULT_MIX = 'browse:50,detail:25,comment:10,follow:10,create:5'
+
+
+def parse_mix(value):
+    """Разбирает строку вида 'browse:50,detail:25' в словарь весов."""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition(':')
+        name = name.strip()
+        if name not in Visitor.actions:
+            raise ValueError(f'Неизвестное действие: {name}')
+        mix[name] = int(weight or 1)
+    if not any(mix.values()):
+        raise ValueError('Хотя бы одно действие должно иметь вес больше 0')
+
+    return mix
+
+
+def percentile(values, percent):
+    """Перцентиль по ближайшему рангу для отсортированного списка."""
+    if not values:
+        return 0
+    rank = max(int(round(percent / 100 * len(values))), 1)
+
+    return values[min(rank, len(values)) - 1]
+
+
+class Stats:
+    """Задержки и коды ответов по именам URL, общие для всех потоков."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    def add(self, name, latency, status):
+        with self.lock:
+            self.latencies[name].append(latency)
+            self.statuses[name][status] += 1
+
+    def report(self, elapsed):
+        """Строки отчёта: по одной на имя URL и итоговая."""
+        rows = []
+        total = errors = 0
+        for name in sorted(self.latencies):
+            latencies = sorted(self.latencies[name])
+            statuses = self.statuses[name]
+            count = len(latencies)
+            codes = ', '.join(
+                f'{status}: {number}'
+                for status, number in sorted(statuses.items(), key=str)
+            )
+            failed = sum(
+                number for status, number in statuses.items()
+                if status == 'error' or status >= 400
+            )
+            total += count
+            errors += failed
+            rows.append(
+                f'{name}: {count} запросов, {count / elapsed:.1f} в секунду, '
+                f'p50 {percentile(latencies, 50) * 1000:.0f} мс, '
+                f'p95 {percentile(latencies, 95) * 1000:.0f} мс, '
+                f'p99 {percentile(latencies, 99) * 1000:.0f} мс, '
+                f'ошибок {failed / count:.1%} ({codes})'
+            )
+        if total:
+            rows.append(
+                f'Всего: {total} запросов за {elapsed:.1f} с, '
+                f'{total / elapsed:.1f} в секунду, ошибок {errors / total:.1%}'
+            )
+
+        return rows
+
+
+class Visitor:
+    """Пользователь нагрузочного теста: анонимная и авторизованная сессии."""
+    actions = ('browse', 'detail', 'comment', 'follow', 'create')
+
+    def __init__(self, base_url, stats, targets, credentials=None,
+                 timeout=10):
+        self.base_url = base_url.rstrip('/')
+        self.stats = stats
+        self.targets = targets
+        self.timeout = timeout
+        self.anonymous = requests.Session()
+        self.session = None
+        if credentials is not None:
+            self.session = requests.Session()
+            self.login(*credentials)
+
+    def request(self, session, name, method, path, **kwargs):
+        kwargs.setdefault('allow_redirects', False)
+        start = time.perf_counter()
+        try:
+            response = session.request(
+                method, self.base_url + path, timeout=self.timeout, **kwargs
+            )
+            status = response.status_code
+        except requests.RequestException:
+            response, status = None, 'error'
+        self.stats.add(name, time.perf_counter() - start, status)
+
+        return response
+
+    def post(self, name, path, data):
+        # Токен CSRF кладёт в cookie любая страница с формой
+        token = self.session.cookies.get('csrftoken', '')
+        return self.request(
+            self.session, name, 'POST', path,
+            data={'csrfmiddlewaretoken': token, **data},
+            headers={'Referer': self.base_url + path},
+        )
+
+    def login(self, username, password):
+        self.request(self.session, 'login', 'GET', '/auth/login/')
+        response = self.post('login', '/auth/login/', {
+            'username': username, 'password': password,
+        })
+        if response is None or response.status_code != 302:
+            raise RuntimeError(f'Не удалось войти как {username}')
+
+    def run(self, action):
+        if self.session is None and action != 'browse':
+            action = 'detail'
+        getattr(self, action)()
+
+    def browse(self):
+        targets = self.targets
+        page = random.randint(1, targets['pages'])
+        pages = [('index', '/'), ('index', f'/?page={page}')]
+        if targets['groups']:
+            slug = random.choice(targets['groups'])
+            pages.append(('group_list', f'/group/{slug}/'))
+        username = random.choice(targets['authors'])
+        pages.append(('profile', f'/profile/{username}/'))
+        name, path = random.choice(pages)
+        self.request(self.anonymous, name, 'GET', path)
+
+    def detail(self):
+        post_id = random.choice(self.targets['posts'])
+        self.request(
+            self.session or self.anonymous, 'post_detail', 'GET',
+            f'/posts/{post_id}/'
+        )
+
+    def comment(self):
+        post_id = random.choice(self.targets['posts'])
+        self.post('add_comment', f'/posts/{post_id}/comment/', {
+            'text': 'Комментарий нагрузочного теста',
+        })
+
+    def follow(self):
+        username = random.choice(self.targets['authors'])
+        action = random.choice(('follow', 'unfollow'))
+        self.request(
+            self.session, f'profile_{action}', 'GET',
+            f'/profile/{username}/{action}/'
+        )
+
+    def create(self):
+        self.post('post_create', '/create/', {
+            'text': 'Пост нагрузочного теста',
+        })
@@ -0,0 +1,109 @@
+import pickle
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import metrics
+from .models import OutboxMessage
+
+
+class OutboxEmailBackend(BaseEmailBackend):
+    """Почтовый бэкенд, который только ставит письма в очередь.
+
+    Запрос не ждёт почтового сервера: письма отправляет фоновый
+    обработчик очереди (manage.py send_outbox).
+    """
+    def send_messages(self, email_messages):
+        queued = []
+        for message in email_messages:
+            if not message.recipients():
+                continue
+            message.connection = None
+            queued.append(OutboxMessage(
+                subject=message.subject[:255],
+                recipients=', '.join(message.recipients()),
+                message=pickle.dumps(message),
+            ))
+        OutboxMessage.objects.bulk_create(queued)
+
+        return len(queued)
+
+
+def claim_batch(now, size):
+    """Закрепляет за обработчиком пачку писем, готовых к отправке.
+
+    Письма откладываются на OUTBOX_LEASE условным UPDATE: из двух
+    обработчиков, выбравших одни и те же письма, их получит только
+    первый. Где база умеет SKIP LOCKED, обработчики сразу выбирают
+    разные строки.
+    """
+    lease = now + timedelta(seconds=settings.OUTBOX_LEASE)
+    ready = OutboxMessage.objects.filter(
+        sent__isnull=True,
+        next_attempt__lte=now,
+        attempts__lt=settings.OUTBOX_MAX_ATTEMPTS,
+    )
+    with transaction.atomic():
+        candidates = ready
+        if connection.features.has_select_for_update_skip_locked:
+            candidates = ready.select_for_update(skip_locked=True)
+        ids = list(candidates.values_list('pk', flat=True)[:size])
+        ready.filter(pk__in=ids).update(next_attempt=lease)
+
+    return list(OutboxMessage.objects.filter(pk__in=ids, next_attempt=lease))
+
+
+def record_failure(item, error, now):
+    item.last_error = repr(error)
+    item.next_attempt = now + timedelta(minutes=2 ** item.attempts)
+
+
+def send_outbox(batch_size=None):
+    """Отправляет пачку писем из очереди через одно соединение.
+
+    Неудачные письма откладываются с растущей паузой, после
+    OUTBOX_MAX_ATTEMPTS попыток остаются в очереди неотправленными.
+    Недоступный почтовый сервер считается неудачной попыткой для всей
+    пачки. Возвращает число отправленных и неудачных писем.
+    """
+    now = timezone.now()
+    batch = claim_batch(now, batch_size or settings.OUTBOX_BATCH_SIZE)
+    if not batch:
+        return 0, 0
+    sent = failed = 0
+    delivery = get_connection(settings.OUTBOX_DELIVERY_BACKEND)
+    try:
+        delivery.open()
+        open_error = None
+    except Exception as error:
+        open_error = error
+    try:
+        for item in batch:
+            item.attempts += 1
+            error = open_error
+            if error is None:
+                try:
+                    delivery.send_messages([pickle.loads(item.message)])
+                except Exception as send_error:
+                    error = send_error
+            if error is None:
+                sent += 1
+                item.sent = timezone.now()
+                item.last_error = ''
+            else:
+                failed += 1
+                record_failure(item, error, now)
+            item.save(update_fields=(
+                'attempts', 'sent', 'next_attempt', 'last_error'
+            ))
+    finally:
+        if open_error is None:
+            delivery.close()
+    metrics.inc('yatube_emails_total', sent, result='sent')
+    metrics.inc('yatube_emails_total', failed, result='failed')
+
+    return sent, failed
@@ -0,0 +1,67 @@
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.template import engines
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+
+from posts.forms import CommentForm
+from posts.models import Group, Post
+from posts.utils import paginator_get_page
+
+
+class Command(BaseCommand):
+    help = 'Замеряет время рендеринга страниц ленты на данных из базы'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=50,
+            help='Сколько раз рендерить каждую страницу',
+        )
+
+    def pages(self, request):
+        """Шаблоны страниц и контексты к ним."""
+        post = Post.objects.select_related('group', 'author').first()
+        if post is None:
+            raise CommandError('В базе нет постов для замера')
+        posts = Post.objects.select_related('group', 'author')
+        yield 'posts/index.html', {
+            'page_obj': paginator_get_page(posts, request),
+        }
+        group = post.group or Group.objects.first()
+        if group is not None:
+            yield 'posts/group_list.html', {
+                'group': group,
+                'page_obj': paginator_get_page(group.posts.all(), request),
+            }
+        yield 'posts/profile.html', {
+            'author': post.author,
+            'following': False,
+            'page_obj': paginator_get_page(post.author.posts.all(), request),
+        }
+        yield 'posts/post_detail.html', {
+            'post': post,
+            'form': CommentForm(),
+            'comments': post.comments.all(),
+        }
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        loaders = engines['django'].engine.loaders
+        self.stdout.write(f'Загрузчики шаблонов: {loaders}')
+        for template_name, context in self.pages(request):
+            # Первый рендер материализует queryset'ы и прогревает шаблон
+            start = time.perf_counter()
+            render_to_string(template_name, context, request)
+            first = time.perf_counter() - start
+            start = time.perf_counter()
+            for _ in range(repeat):
+                render_to_string(template_name, context, request)
+            average = (time.perf_counter() - start) / repeat
+            self.stdout.write(
+                f'{template_name}: первый рендер {first * 1000:.2f} мс, '
+                f'далее {average * 1000:.2f} мс на страницу'
+            )
@@ -0,0 +1,142 @@
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.loadtest import DEFAULT_MIX, Stats, Visitor, parse_mix
+from posts.constants import NUMBER_OF_POSTS
+from posts.models import Group, Post, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагружает запущенный сервер смесью просмотров и записей '
+        'и печатает пропускную способность, задержки и ошибки по URL'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            help='Адрес сервера; без него поднимается runserver '
+                 'на свободном порту',
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=8,
+            help='Сколько потоков отправляют запросы одновременно',
+        )
+        parser.add_argument(
+            '--duration', type=float, default=30,
+            help='Длительность теста, секунд',
+        )
+        parser.add_argument(
+            '--users', type=int, default=8,
+            help='Сколько пользователей loadtest-N создать и авторизовать',
+        )
+        parser.add_argument(
+            '--password', default='loadtest-password',
+            help='Пароль пользователей loadtest-N',
+        )
+        parser.add_argument(
+            '--mix', default=DEFAULT_MIX,
+            help='Веса действий browse, detail, comment, follow, create',
+        )
+
+    def ensure_users(self, count, password):
+        """Создаёт недостающих пользователей нагрузочного теста."""
+        credentials = []
+        for number in range(count):
+            username = f'loadtest-{number}'
+            user, created = User.objects.get_or_create(username=username)
+            if created or not user.check_password(password):
+                user.set_password(password)
+                user.save()
+            credentials.append((username, password))
+
+        return credentials
+
+    def targets(self):
+        """Посты, группы и авторы, к которым обращаются посетители."""
+        posts = list(Post.objects.values_list('pk', flat=True)[:1000])
+        if not posts:
+            raise CommandError('В базе нет постов для нагрузочного теста')
+
+        return {
+            'posts': posts,
+            'pages': max(len(posts) // NUMBER_OF_POSTS, 1),
+            'groups': list(Group.objects.values_list('slug', flat=True)),
+            'authors': list(User.objects.filter(
+                posts__isnull=False
+            ).values_list('username', flat=True).distinct()),
+        }
+
+    def start_server(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        url = f'http://127.0.0.1:{port}'
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'),
+             'runserver', '--noreload', f'127.0.0.1:{port}'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                requests.get(url, timeout=1)
+                return server, url
+            except requests.ConnectionError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError('Сервер не запустился за 30 секунд')
+
+    def work(self, visitor, mix, deadline):
+        actions, weights = zip(*mix.items())
+        while time.monotonic() < deadline:
+            visitor.run(random.choices(actions, weights)[0])
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as error:
+            raise CommandError(error)
+        targets = self.targets()
+        credentials = self.ensure_users(options['users'], options['password'])
+        server, url = None, options['url']
+        if url is None:
+            server, url = self.start_server()
+        stats = Stats()
+        try:
+            visitors = [
+                Visitor(url, stats, targets,
+                        credentials[number % len(credentials)]
+                        if credentials else None)
+                for number in range(options['concurrency'])
+            ]
+            self.stdout.write(
+                f'{url}: {len(visitors)} потоков, '
+                f'{options["duration"]:.0f} с, смесь {mix}'
+            )
+            start = time.monotonic()
+            deadline = start + options['duration']
+            with ThreadPoolExecutor(len(visitors)) as pool:
+                for future in [
+                    pool.submit(self.work, visitor, mix, deadline)
+                    for visitor in visitors
+                ]:
+                    future.result()
+            elapsed = time.monotonic() - start
+        except RuntimeError as error:
+            raise CommandError(error)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+        for row in stats.report(elapsed):
+            self.stdout.write(row)
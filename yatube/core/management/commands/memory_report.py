@@ -0,0 +1,65 @@
+import json
+import os
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.profiling import profile_paths
+
+
+def kib(size):
+    return f'{size / 1024:.1f} КиБ'
+
+
+class Command(BaseCommand):
+    help = (
+        'Сводит профили памяти (?profile=memory) по именам URL: пик, '
+        'оставшийся прирост и места выделения, которые его дали'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'views', nargs='*',
+            help='Имена URL, например posts:index; по умолчанию все',
+        )
+        parser.add_argument('--dir', default=settings.PROFILE_DIR)
+        parser.add_argument(
+            '--top', type=int, default=10,
+            help='Сколько мест выделения показывать для каждого URL',
+        )
+
+    def handle(self, *args, **options):
+        directory = options['dir']
+        paths = profile_paths(directory, options['views'], 'memory')
+        if not paths:
+            raise CommandError(f'В {directory} нет профилей памяти')
+        by_view = defaultdict(list)
+        for path in paths:
+            view = os.path.basename(os.path.dirname(path)).replace('.', ':')
+            with open(path) as file:
+                by_view[view].append(json.load(file))
+
+        for view, samples in sorted(by_view.items()):
+            count = len(samples)
+            peaks = [sample['peak'] for sample in samples]
+            retained = [sample['retained'] for sample in samples]
+            queries = sum(sample['queries_logged'] for sample in samples)
+            self.stdout.write(
+                f'{view}: запросов {count}, '
+                f'пик в среднем {kib(sum(peaks) / count)} '
+                f'(макс. {kib(max(peaks))}), '
+                f'остаётся в среднем {kib(sum(retained) / count)} '
+                f'(макс. {kib(max(retained))}), '
+                f'запросов к БД в логе DEBUG: {queries}'
+            )
+            sites, allocations = Counter(), Counter()
+            for sample in samples:
+                for site, size, number in sample['sites']:
+                    sites[site] += size
+                    allocations[site] += number
+            for site, size in sites.most_common(options['top']):
+                self.stdout.write(
+                    f'  {kib(size / count):>12} на запрос '
+                    f'{allocations[site] / count:8.1f} блоков  {site}'
+                )
@@ -0,0 +1,80 @@
+import io
+import pstats
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.profiling import load_stacks, profile_paths
+
+
+class Command(BaseCommand):
+    help = (
+        'Сводит сохранённые профили запросов в таблицы самых затратных '
+        'функций и свёрнутые стеки для flame graph'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'views', nargs='*',
+            help='Имена URL, например posts:index; по умолчанию все',
+        )
+        parser.add_argument('--dir', default=settings.PROFILE_DIR)
+        parser.add_argument(
+            '--top', type=int, default=20,
+            help='Сколько функций показывать в таблицах',
+        )
+        parser.add_argument(
+            '--sort', default='cumulative',
+            choices=('cumulative', 'tottime', 'ncalls'),
+            help='Порядок таблицы cProfile',
+        )
+        parser.add_argument(
+            '--collapsed',
+            help='Файл для свёрнутых стеков сэмплера (flamegraph.pl, '
+                 'speedscope)',
+        )
+
+    def report_cprofile(self, paths, sort, top):
+        stream = io.StringIO()
+        stats = pstats.Stats(*paths, stream=stream)
+        stats.sort_stats(sort).print_stats(top)
+        self.stdout.write(f'cProfile, профилей: {len(paths)}')
+        self.stdout.write(stream.getvalue())
+
+    def report_stacks(self, paths, top, collapsed):
+        stacks = load_stacks(paths)
+        total = sum(stacks.values())
+        own, inclusive = Counter(), Counter()
+        for stack, count in stacks.items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            # Рекурсивная функция учитывается в стеке один раз
+            for frame in set(frames):
+                inclusive[frame] += count
+        self.stdout.write(
+            f'Сэмплер, профилей: {len(paths)}, снимков стека: {total}'
+        )
+        if collapsed:
+            with open(collapsed, 'w') as file:
+                for stack, count in stacks.most_common():
+                    file.write(f'{stack} {count}\n')
+            self.stdout.write(f'Свёрнутые стеки записаны в {collapsed}')
+        if not total:
+            return
+        for title, counter in (('Собственное время', own),
+                               ('Время с вложенными вызовами', inclusive)):
+            self.stdout.write(title)
+            for frame, count in counter.most_common(top):
+                self.stdout.write(f'{count / total:7.1%} {count:7d}  {frame}')
+
+    def handle(self, *args, **options):
+        directory, views = options['dir'], options['views']
+        cprofile = profile_paths(directory, views, 'cprofile')
+        stacks = profile_paths(directory, views, 'sampler')
+        if not cprofile and not stacks:
+            raise CommandError(f'В {directory} нет профилей')
+        if cprofile:
+            self.report_cprofile(cprofile, options['sort'], options['top'])
+        if stacks:
+            self.report_stacks(stacks, options['top'], options['collapsed'])
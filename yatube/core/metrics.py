@@ -0,0 +1,230 @@
+"""Метрики в формате Prometheus, общие для всех процессов.
+
+Каждый процесс копит счётчики в памяти. Процессы сервера (см.
+yatube/wsgi.py) включают сброс вызовом start() и время от времени пишут
+их в METRICS_DIR/<pid>.json; тесты и команды управления файлов не
+пишут. /metrics любого процесса складывает файлы всех процессов, поэтому
+при сборе видны суммы по серверу. При старте процесса сервера удаляются
+файлы умерших процессов и прежний файл с его pid, чтобы старые счётчики
+не прибавлялись к новым.
+"""
+import atexit
+import glob
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'),
+)
+
+FAMILIES = {
+    'yatube_request_duration_seconds': (
+        'histogram', 'Время обработки запроса по имени URL'
+    ),
+    'yatube_requests_total': ('counter', 'Ответы по имени URL и коду'),
+    'yatube_db_queries_total': (
+        'counter', 'Запросы к базе данных по имени URL'
+    ),
+    'yatube_page_cache_requests_total': (
+        'counter', 'Обращения к кэшу страниц (cache_page) по имени URL'
+    ),
+    'yatube_thumbnail_kvstore_lookups_total': (
+        'counter', 'Обращения к LRU миниатюр в памяти процесса'
+    ),
+    'yatube_objects_created_total': (
+        'counter', 'Созданные посты, комментарии и подписки'
+    ),
+    'yatube_throttled_total': (
+        'counter', 'Запросы, отклонённые лимитом частоты (429)'
+    ),
+    'yatube_emails_total': ('counter', 'Попытки отправки писем из очереди'),
+    'yatube_outbox_messages': ('gauge', 'Письма в очереди по состоянию'),
+}
+
+
+def sample_name(name, **labels):
+    """Имя сэмпла с метками: name{label="value",...}."""
+    if not labels:
+        return name
+    pairs = ','.join(
+        '{}="{}"'.format(
+            label, str(value).replace('\\', r'\\').replace('"', r'\"')
+        )
+        for label, value in sorted(labels.items())
+    )
+
+    return f'{name}{{{pairs}}}'
+
+
+def sort_key(sample):
+    """Сэмплы гистограммы по возрастанию le, остальные — по имени."""
+    match = re.search(r',?le="([^"]+)"', sample)
+    if match is None:
+        return sample, 0
+    bound = float(match.group(1).replace('+Inf', 'inf'))
+
+    return sample[:match.start()] + sample[match.end():], bound
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """Счётчики процесса и их сброс в файл."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = defaultdict(float)
+        self.collectors = []
+        self.flushed = 0
+        self.enabled = False
+
+    def inc(self, name, amount=1, **labels):
+        with self.lock:
+            self.values[sample_name(name, **labels)] += amount
+        self.maybe_flush()
+
+    def observe(self, name, value, **labels):
+        """Добавляет наблюдение в гистограмму name."""
+        with self.lock:
+            for bound in LATENCY_BUCKETS:
+                if value <= bound:
+                    self.values[sample_name(
+                        f'{name}_bucket', le=format_value(bound), **labels
+                    )] += 1
+            self.values[sample_name(f'{name}_sum', **labels)] += value
+            self.values[sample_name(f'{name}_count', **labels)] += 1
+        self.maybe_flush()
+
+    def collector(self, func):
+        """Регистрирует функцию, возвращающую {сэмпл: значение} процесса.
+
+        Она вызывается при каждом сбросе, значения заменяют прежние.
+        """
+        self.collectors.append(func)
+        return func
+
+    def path(self, pid=None):
+        return os.path.join(
+            settings.METRICS_DIR, f'{pid or os.getpid()}.json'
+        )
+
+    def start(self):
+        """Включает сброс в файл и удаляет устаревшие файлы процессов.
+
+        Файл с pid этого процесса остался от умершего процесса с тем же
+        pid: сам процесс ещё ничего не сбрасывал.
+        """
+        self.enabled = True
+        for path in glob.glob(self.path('*')):
+            pid = os.path.basename(path).partition('.')[0]
+            if not pid.isdigit():
+                continue
+            if int(pid) == os.getpid() or not pid_alive(int(pid)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def maybe_flush(self):
+        if not self.enabled:
+            return
+        if time.monotonic() - self.flushed >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def snapshot(self):
+        """Значения процесса вместе с коллекторами."""
+        with self.lock:
+            values = dict(self.values)
+            self.flushed = time.monotonic()
+        for func in self.collectors:
+            values.update(func())
+
+        return values
+
+    def flush(self):
+        values = self.snapshot()
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        path = self.path()
+        # Запись через временный файл: при сборе файл всегда целый
+        with open(f'{path}.tmp', 'w') as file:
+            json.dump(values, file)
+        os.replace(f'{path}.tmp', path)
+
+    def collect(self):
+        """Суммы по всем процессам (и по этому, даже без сброса)."""
+        totals = defaultdict(float)
+        if self.enabled:
+            self.flush()
+        else:
+            totals.update(self.snapshot())
+        for path in glob.glob(self.path('*')):
+            try:
+                with open(path) as file:
+                    values = json.load(file)
+            except (OSError, ValueError):
+                continue
+            for sample, value in values.items():
+                totals[sample] += value
+
+        return totals
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    return True
+
+
+registry = Registry()
+inc = registry.inc
+observe = registry.observe
+collector = registry.collector
+
+
+@atexit.register
+def flush_on_exit():
+    if registry.enabled and registry.values:
+        registry.flush()
+
+
+def family(sample):
+    name = sample.partition('{')[0]
+    if name not in FAMILIES:
+        for suffix in ('_bucket', '_sum', '_count'):
+            if name.endswith(suffix):
+                return name[:-len(suffix)]
+
+    return name
+
+
+def exposition(totals):
+    """Текст в формате Prometheus из словаря {сэмпл: значение}."""
+    by_family = defaultdict(list)
+    for sample, value in totals.items():
+        by_family[family(sample)].append((sample, value))
+    lines = []
+    for name in sorted(by_family):
+        kind, help_text = FAMILIES.get(name, ('untyped', ''))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        samples = sorted(by_family[name], key=lambda item: sort_key(item[0]))
+        for sample, value in samples:
+            lines.append(f'{sample} {format_value(value)}')
+
+    return '\n'.join(lines) + '\n'
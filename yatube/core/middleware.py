@@ -0,0 +1,306 @@
+import json
+import mimetypes
+import os
+import random
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from . import metrics
+from .compression import (
+    COMPRESSIBLE_TYPES, cached_compress, compress_body, supported_encodings
+)
+from .profiling import PROFILE_EXTENSIONS, profile_call, save_profile
+from .storage import CompressedManifestStaticFilesStorage
+
+FOREVER = 'public, max-age=31536000, immutable'
+
+
+def accepted_encodings(request):
+    """Кодировки из Accept-Encoding, которые клиент не запретил (q=0)."""
+    encodings = set()
+    header = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    for item in header.split(','):
+        encoding, _, params = item.partition(';')
+        _, _, quality = params.replace(' ', '').partition('q=')
+        try:
+            allowed = float(quality or 1) > 0
+        except ValueError:
+            allowed = False
+        if encoding.strip() and allowed:
+            encodings.add(encoding.strip().lower())
+
+    return encodings
+
+
+class StaticFile:
+    """Файл из STATIC_ROOT со сжатыми копиями и заголовками кэширования."""
+    def __init__(self, path, immutable):
+        stat = os.stat(path)
+        self.path = path
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.content_type = (
+            mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        )
+        self.cache_control = FOREVER if immutable else 'public, max-age=60'
+        self.variants = []
+        suffixes = CompressedManifestStaticFilesStorage.encoding_suffixes
+        # brotli плотнее gzip, поэтому предлагается первым
+        for encoding in ('br', 'gzip'):
+            compressed_path = path + suffixes[encoding]
+            if os.path.isfile(compressed_path):
+                size = os.path.getsize(compressed_path)
+                self.variants.append((encoding, compressed_path, size))
+
+    def choose(self, encodings):
+        for encoding, path, size in self.variants:
+            if encoding in encodings:
+                return encoding, path, size
+
+        return None, self.path, self.size
+
+
+class StaticFilesMiddleware:
+    """Отдаёт собранную collectstatic статику без похода во view.
+
+    Файлы с хэшем в имени кэшируются клиентом навсегда, сжатые копии
+    выбираются по Accept-Encoding. Список файлов читается один раз при
+    старте процесса.
+    """
+    def __init__(self, get_response):
+        root = settings.STATIC_ROOT
+        if not root or not os.path.isdir(root):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.files = self.scan(root)
+
+    @staticmethod
+    def scan(root):
+        manifest_path = os.path.join(
+            root, CompressedManifestStaticFilesStorage.manifest_name
+        )
+        hashed_names = set()
+        if os.path.isfile(manifest_path):
+            with open(manifest_path) as manifest:
+                hashed_names = set(json.load(manifest)['paths'].values())
+        compressed_suffixes = tuple(
+            CompressedManifestStaticFilesStorage.encoding_suffixes.values()
+        )
+        files = {}
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.endswith(compressed_suffixes):
+                    continue
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, root).replace(os.sep, '/')
+                files[settings.STATIC_URL + name] = StaticFile(
+                    path, name in hashed_names
+                )
+
+        return files
+
+    def __call__(self, request):
+        static_file = self.files.get(request.path_info)
+        if static_file is None or request.method not in ('GET', 'HEAD'):
+            return self.get_response(request)
+
+        if not was_modified_since(
+            request.META.get('HTTP_IF_MODIFIED_SINCE'),
+            static_file.mtime, static_file.size
+        ):
+            response = HttpResponseNotModified()
+        else:
+            encoding, path, size = static_file.choose(
+                accepted_encodings(request)
+            )
+            response = FileResponse(
+                open(path, 'rb'), content_type=static_file.content_type
+            )
+            response['Content-Length'] = size
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['Last-Modified'] = http_date(static_file.mtime)
+        response['Cache-Control'] = static_file.cache_control
+        if static_file.variants:
+            response['Vary'] = 'Accept-Encoding'
+
+        return response
+
+
+class ProfilingMiddleware:
+    """Профилирует отдельные запросы и сохраняет профили на диск.
+
+    Сотрудник включает профилирование заголовком X-Profile или параметром
+    ?profile=, значение выбирает режим: cprofile или sampler (память
+    профилирует MemoryProfilingMiddleware). Кроме того, под
+    профилировщиком выполняется доля PROFILE_SAMPLE_RATE всех запросов.
+    Отчёт по сохранённым профилям — manage.py profile_report.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    @staticmethod
+    def staff_flag(request):
+        flag = request.META.get('HTTP_X_PROFILE') or request.GET.get('profile')
+        if flag and getattr(request, 'user', None) and request.user.is_staff:
+            return flag
+
+        return None
+
+    def requested_mode(self, request):
+        flag = self.staff_flag(request)
+        if flag == 'memory':
+            return None
+        if flag:
+            if flag in PROFILE_EXTENSIONS:
+                return flag
+            return settings.PROFILE_MODE
+        if random.random() < settings.PROFILE_SAMPLE_RATE:
+            return settings.PROFILE_MODE
+
+        return None
+
+    def __call__(self, request):
+        mode = self.requested_mode(request)
+        if mode is None:
+            return self.get_response(request)
+
+        response, profiler = profile_call(mode, self.get_response, request)
+        if profiler is None:
+            return response
+        match = request.resolver_match
+        path = save_profile(
+            profiler, mode, match.view_name if match else 'unresolved'
+        )
+        response['X-Profile'] = os.path.relpath(path, settings.PROFILE_DIR)
+
+        return response
+
+
+class MemoryProfilingMiddleware(ProfilingMiddleware):
+    """Снимки tracemalloc вокруг выбранных запросов.
+
+    Включается настройкой MEMORY_PROFILING. Трассируются запросы
+    сотрудников с ?profile=memory (или X-Profile: memory) и доля
+    MEMORY_SAMPLE_RATE всех запросов; отчёт — manage.py memory_report.
+    """
+    def __init__(self, get_response):
+        if not settings.MEMORY_PROFILING:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def requested_mode(self, request):
+        if (self.staff_flag(request) == 'memory'
+                or random.random() < settings.MEMORY_SAMPLE_RATE):
+            return 'memory'
+
+        return None
+
+
+class MetricsMiddleware:
+    """Считает время ответа, запросы к базе и попадания в кэш страниц.
+
+    Стоит первым, чтобы время включало всю цепочку middleware.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        with connection.execute_wrapper(count_queries):
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        if match is not None:
+            view = match.view_name
+        elif request.path_info.startswith(settings.STATIC_URL):
+            view = 'static'
+        else:
+            view = 'unresolved'
+        metrics.observe('yatube_request_duration_seconds', duration, view=view)
+        metrics.inc(
+            'yatube_requests_total', view=view, status=response.status_code
+        )
+        if queries:
+            metrics.inc('yatube_db_queries_total', queries, view=view)
+        # cache_page помечает запрос: False — ответ взят из кэша
+        update_cache = getattr(request, '_cache_update_cache', None)
+        if update_cache is not None and request.method in ('GET', 'HEAD'):
+            metrics.inc(
+                'yatube_page_cache_requests_total', view=view,
+                result='miss' if update_cache else 'hit',
+            )
+
+        return response
+
+
+class CompressionMiddleware:
+    """Сжимает ответы gzip или brotli по Accept-Encoding.
+
+    Сжатые тела кэшируются по хэшу содержимого, поэтому одинаковые
+    страницы (в том числе отданные из cache_page) повторно не сжимаются.
+    Страницы с токеном CSRF уникальны, их сжатие не кэшируется; для них
+    используется только gzip со случайной добавкой к длине против BREACH.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    @staticmethod
+    def compressible(response):
+        return (
+            not response.streaming
+            and not response.has_header('Content-Encoding')
+            and response.get('Content-Type', '').startswith(
+                COMPRESSIBLE_TYPES
+            )
+            and len(response.content) >= settings.COMPRESSION_MIN_LENGTH
+        )
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not self.compressible(response):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        with_csrf = request.META.get('CSRF_COOKIE_USED', False)
+        accepted = accepted_encodings(request)
+        encoding = next((
+            encoding for encoding in supported_encodings()
+            if encoding in accepted and not (with_csrf and encoding != 'gzip')
+        ), None)
+        if encoding is None:
+            return response
+
+        content = response.content
+        if with_csrf:
+            compressed = compress_body(
+                content, encoding, settings.COMPRESSION_MAX_RANDOM_BYTES
+            )
+        else:
+            compressed = cached_compress(content, encoding)
+        if len(compressed) >= len(content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # Сжатое тело побайтно отличается от исходного
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+
+        return response
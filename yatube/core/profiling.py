@@ -0,0 +1,216 @@
+import cProfile
+import gc
+import glob
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+
+PROFILE_EXTENSIONS = {
+    'cprofile': '.prof', 'sampler': '.stacks', 'memory': '.memory.json',
+}
+
+
+def frame_name(frame):
+    code = frame.f_code
+    module = frame.f_globals.get('__name__', os.path.basename(
+        code.co_filename
+    ))
+
+    return f'{module}:{code.co_name}'
+
+
+class StackSampler:
+    """Снимает стек одного потока с заданным интервалом.
+
+    В отличие от cProfile не перехватывает каждый вызов, поэтому почти
+    не замедляет запрос; результат — счётчик свёрнутых стеков
+    в формате flamegraph.pl (функции через ';' от корня к листу).
+    """
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append(frame_name(frame))
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def dump_stats(self, path):
+        with open(path, 'w') as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f'{stack} {count}\n')
+
+
+class MemoryTracer:
+    """Снимок tracemalloc вокруг одного запроса.
+
+    Запоминает пик и оставшийся после запроса прирост памяти и места
+    выделения, которые этот прирост дали. tracemalloc видит память всего
+    процесса, поэтому одновременно трассируется только один запрос, но
+    выделения соседних потоков в замер всё равно попадают.
+    """
+    lock = threading.Lock()
+    filters = (
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+        tracemalloc.Filter(False, __file__),
+    )
+
+    def __init__(self, frames, top):
+        self.frames = frames
+        self.top = top
+        self.started = False
+        self.before = None
+        self.sites = []
+
+    def __enter__(self):
+        self.started = not tracemalloc.is_tracing()
+        if self.started:
+            tracemalloc.start(self.frames)
+        else:
+            self.before = tracemalloc.take_snapshot().filter_traces(
+                self.filters
+            )
+            # reset_peak есть только с Python 3.9
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+        self.start_size, self.start_peak = tracemalloc.get_traced_memory()
+        self.queries = len(connection.queries_log)
+        return self
+
+    def __exit__(self, *exc_info):
+        # Циклический мусор к утечкам не относится
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces(self.filters)
+        if self.started:
+            tracemalloc.stop()
+        self.retained = current - self.start_size
+        if peak > self.start_peak or self.start_peak == self.start_size:
+            self.peak = peak - self.start_size
+        else:
+            # Пик процесса был до запроса и не сброшен: известна только
+            # нижняя оценка пика запроса
+            self.peak = max(self.retained, 0)
+        self.queries = len(connection.queries_log) - self.queries
+        if self.before is None:
+            statistics = [
+                (stat.traceback, stat.size, stat.count)
+                for stat in snapshot.statistics('lineno')
+            ]
+        else:
+            statistics = [
+                (stat.traceback, stat.size_diff, stat.count_diff)
+                for stat in snapshot.compare_to(self.before, 'lineno')
+            ]
+        self.sites = [
+            (str(traceback[0]), size, count)
+            for traceback, size, count in statistics[:self.top]
+            if size > 0
+        ]
+
+    def dump_stats(self, path):
+        with open(path, 'w') as file:
+            json.dump({
+                'peak': self.peak,
+                'retained': self.retained,
+                'queries_logged': self.queries,
+                'sites': self.sites,
+            }, file)
+
+
+def profile_call(mode, func, *args):
+    """Вызывает func под профилировщиком; возвращает результат и профиль.
+
+    Если трассировка памяти уже идёт в другом потоке, запрос выполняется
+    без профилирования, а вместо профиля возвращается None.
+    """
+    if mode == 'memory':
+        if not MemoryTracer.lock.acquire(blocking=False):
+            return func(*args), None
+        try:
+            with MemoryTracer(
+                settings.MEMORY_TRACE_FRAMES, settings.MEMORY_TOP_SITES
+            ) as profiler:
+                result = func(*args)
+        finally:
+            MemoryTracer.lock.release()
+    elif mode == 'sampler':
+        with StackSampler(
+            threading.get_ident(), settings.PROFILE_SAMPLER_INTERVAL
+        ) as profiler:
+            result = func(*args)
+    else:
+        profiler = cProfile.Profile()
+        result = profiler.runcall(func, *args)
+
+    return result, profiler
+
+
+def save_profile(profiler, mode, view_name):
+    """Сохраняет профиль в PROFILE_DIR/<имя URL>/ и возвращает путь."""
+    directory = os.path.join(
+        settings.PROFILE_DIR, view_name.replace(':', '.')
+    )
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, '{}-{}'.format(
+        time.strftime('%Y%m%d-%H%M%S'), os.getpid()
+    ))
+    extension = PROFILE_EXTENSIONS[mode]
+    path = base + extension
+    # Имя с точностью до секунды может совпасть у соседних запросов
+    number = 1
+    while os.path.exists(path):
+        path = f'{base}-{number}{extension}'
+        number += 1
+    profiler.dump_stats(path)
+
+    return path
+
+
+def profile_paths(directory, views, mode):
+    """Файлы профилей режима mode для имён URL views (или всех)."""
+    names = [view.replace(':', '.') for view in views] or ['*']
+    paths = []
+    for name in names:
+        paths.extend(sorted(glob.glob(
+            os.path.join(directory, name, '*' + PROFILE_EXTENSIONS[mode])
+        )))
+
+    return paths
+
+
+def load_stacks(paths):
+    """Суммирует свёрнутые стеки из файлов сэмплера."""
+    stacks = Counter()
+    for path in paths:
+        with open(path) as file:
+            for line in file:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack:
+                    stacks[stack] += int(count)
+
+    return stacks
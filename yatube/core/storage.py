@@ -0,0 +1,47 @@
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = (
+    '.css', '.js', '.svg', '.ico', '.json', '.txt', '.xml', '.map',
+)
+
+
+def compress(content):
+    """Сжатые варианты содержимого по кодировкам HTTP."""
+    variants = {'gzip': gzip.compress(content, compresslevel=9)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(content)
+
+    return variants
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Статика с хэшем в имени и сжатыми копиями .gz и .br рядом."""
+    encoding_suffixes = {'gzip': '.gz', 'br': '.br'}
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if name.endswith(COMPRESSIBLE_EXTENSIONS):
+                self.save_compressed(name)
+
+    def save_compressed(self, name):
+        with self.open(name) as original:
+            content = original.read()
+        for encoding, compressed in compress(content).items():
+            compressed_name = name + self.encoding_suffixes[encoding]
+            if self.exists(compressed_name):
+                self.delete(compressed_name)
+            # Сжатая копия, которая не меньше оригинала, бесполезна
+            if len(compressed) < len(content):
+                self._save(compressed_name, ContentFile(compressed))
@@ -1,8 +1,23 @@
 from django import template
 
+from posts.follows import is_following
+
 register = template.Library()
 
 
 @register.filter
 def addclass(field, css):
     return field.as_widget(attrs={'class': css})
+
+
+@register.filter
+def followed_by(author, user):
+    """Подписан ли user на author: {% if post.author|followed_by:user %}.
+
+    Все проверки страницы идут по одному массиву id из кэша, без
+    запроса к базе на каждого автора.
+    """
+    if not getattr(user, 'is_authenticated', False):
+        return False
+
+    return is_following(user, author.pk)
@@ -1,6 +1,37 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import tracemalloc
 from http import HTTPStatus
+from io import StringIO
+from unittest import mock
 
-from django.test import TestCase
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.template import TemplateSyntaxError
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from . import metrics
+from .checks import check_templates_compile
+from .loadtest import Stats, parse_mix, percentile
+from .mail import claim_batch, send_outbox
+from .middleware import FOREVER, StaticFilesMiddleware
+from .models import OutboxMessage
+from .profiling import MemoryTracer, load_stacks
+
+TEMP_STATIC_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+TEMP_PROFILE_DIR = tempfile.mkdtemp(dir=settings.BASE_DIR)
+TEMP_METRICS_DIR = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
 class ViewTestClass(TestCase):
@@ -9,3 +40,430 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, template)
+
+
+class TemplateChecksTest(TestCase):
+    def test_project_templates_compile(self):
+        """Все шаблоны проекта компилируются без ошибок"""
+        self.assertEqual(check_templates_compile(None), [])
+
+    @override_settings(TEMPLATES_CACHED=True)
+    def test_startup_logs_broken_templates(self):
+        """Шаблон с ошибкой при старте попадает в лог"""
+        error = TemplateSyntaxError('unclosed tag')
+        with mock.patch(
+            'core.checks.compile_templates',
+            return_value={'posts/broken.html': error},
+        ), self.assertLogs('core.apps', 'ERROR') as logs:
+            apps.get_app_config('core').ready()
+        self.assertIn('posts/broken.html', logs.output[0])
+
+
+@override_settings(STATIC_ROOT=TEMP_STATIC_ROOT)
+class StaticFilesMiddlewareTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        files = {
+            'app.css': b'body {}' * 100,
+            'app.0123456789ab.css': b'body {}' * 100,
+        }
+        for name, content in files.items():
+            with open(os.path.join(TEMP_STATIC_ROOT, name), 'wb') as file:
+                file.write(content)
+            path = os.path.join(TEMP_STATIC_ROOT, name + '.gz')
+            with open(path, 'wb') as file:
+                file.write(gzip.compress(content))
+        manifest = os.path.join(TEMP_STATIC_ROOT, 'staticfiles.json')
+        with open(manifest, 'w') as file:
+            json.dump({
+                'paths': {'app.css': 'app.0123456789ab.css'},
+                'version': '1.0',
+            }, file)
+        cls.middleware = StaticFilesMiddleware(
+            lambda request: HttpResponse('view')
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_STATIC_ROOT, ignore_errors=True)
+
+    def test_hashed_file_cached_forever(self):
+        """Файл с хэшем в имени кэшируется навсегда, сжатие по запросу"""
+        request = RequestFactory().get(
+            '/static/app.0123456789ab.css', HTTP_ACCEPT_ENCODING='gzip'
+        )
+        response = self.middleware(request)
+        self.assertEqual(response['Cache-Control'], FOREVER)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(
+            gzip.decompress(b''.join(response.streaming_content)),
+            b'body {}' * 100
+        )
+
+    def test_plain_file_without_accept_encoding(self):
+        """Без Accept-Encoding отдаётся несжатый файл с коротким кэшем"""
+        response = self.middleware(RequestFactory().get('/static/app.css'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertNotEqual(response['Cache-Control'], FOREVER)
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_other_paths_go_to_view(self):
+        """Запросы не к статике проходят дальше"""
+        response = self.middleware(RequestFactory().get('/static/none.css'))
+        self.assertEqual(response.content, b'view')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        for directory in ('posts', 'cache'):
+            os.makedirs(os.path.join(TEMP_MEDIA_ROOT, directory))
+            path = os.path.join(TEMP_MEDIA_ROOT, directory, 'image.jpg')
+            with open(path, 'wb') as file:
+                file.write(bytes(range(100)))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_full_file(self):
+        """Файл отдаётся целиком с поддержкой диапазонов"""
+        response = self.client.get('/media/posts/image.jpg')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(
+            b''.join(response.streaming_content), bytes(range(100))
+        )
+        response = self.client.get(
+            '/media/posts/image.jpg',
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_range(self):
+        """Range отдаёт только запрошенные байты"""
+        ranges = {
+            'bytes=10-19': (bytes(range(10, 20)), 'bytes 10-19/100'),
+            'bytes=95-': (bytes(range(95, 100)), 'bytes 95-99/100'),
+            'bytes=-3': (bytes(range(97, 100)), 'bytes 97-99/100'),
+        }
+        for header, (content, content_range) in ranges.items():
+            with self.subTest(header=header):
+                response = self.client.get(
+                    '/media/posts/image.jpg', HTTP_RANGE=header
+                )
+                self.assertEqual(
+                    response.status_code, HTTPStatus.PARTIAL_CONTENT
+                )
+                self.assertEqual(response['Content-Range'], content_range)
+                self.assertEqual(
+                    b''.join(response.streaming_content), content
+                )
+        response = self.client.get(
+            '/media/posts/image.jpg', HTTP_RANGE='bytes=200-'
+        )
+        self.assertEqual(
+            response.status_code, HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+        )
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Range'], 'bytes */100')
+
+    def test_thumbnail_is_immutable(self):
+        """Миниатюры кэшируются навсегда"""
+        response = self.client.get('/media/cache/image.jpg')
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_hashed_original_is_immutable(self):
+        """Картинки с именем по хэшу содержимого кэшируются навсегда"""
+        digest = hashlib.sha256(b'image').hexdigest()
+        directory = os.path.join(
+            TEMP_MEDIA_ROOT, 'posts', digest[:2], digest[2:4]
+        )
+        os.makedirs(directory)
+        with open(os.path.join(directory, f'{digest}.jpg'), 'wb') as file:
+            file.write(b'image')
+        response = self.client.get(
+            f'/media/posts/{digest[:2]}/{digest[2:4]}/{digest}.jpg'
+        )
+        self.assertEqual(response['Cache-Control'], FOREVER)
+        response = self.client.get('/media/posts/image.jpg')
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+    @override_settings(MEDIA_SENDFILE_BACKEND='x-accel-redirect')
+    def test_accel_redirect(self):
+        """Передача файла поручается nginx"""
+        response = self.client.get('/media/posts/image.jpg')
+        self.assertEqual(
+            response['X-Accel-Redirect'], '/protected-media/posts/image.jpg'
+        )
+        self.assertEqual(response.content, b'')
+
+    def test_outside_media_root(self):
+        """Файлы вне MEDIA_ROOT недоступны"""
+        response = self.client.get('/media/../manage.py')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+@override_settings(
+    EMAIL_BACKEND='core.mail.OutboxEmailBackend',
+    OUTBOX_DELIVERY_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+)
+class OutboxTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        get_user_model().objects.create_user(
+            username='auth', email='auth@example.com', password='pass'
+        )
+
+    def request_reset(self):
+        self.client.post(
+            '/auth/password_reset/', {'email': 'auth@example.com'}
+        )
+
+    def test_reset_email_queued_then_sent(self):
+        """Письмо сброса пароля ставится в очередь и уходит из неё"""
+        self.request_reset()
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+        self.assertEqual(send_outbox(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['auth@example.com'])
+        self.assertEqual(send_outbox(), (0, 0))
+
+    def test_failed_email_retried_later(self):
+        """Неудачная отправка откладывается на потом"""
+        self.request_reset()
+        with mock.patch(
+            'django.core.mail.backends.locmem.EmailBackend.send_messages',
+            side_effect=ConnectionError('SMTP недоступен'),
+        ):
+            self.assertEqual(send_outbox(), (0, 1))
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.attempts, 1)
+        self.assertIn('SMTP недоступен', message.last_error)
+        self.assertEqual(send_outbox(), (0, 0))
+
+    def test_connection_error_recorded(self):
+        """Недоступный сервер — неудачная попытка, а не падение обработчика"""
+        self.request_reset()
+        with mock.patch(
+            'django.core.mail.backends.locmem.EmailBackend.open',
+            side_effect=ConnectionError('SMTP недоступен'),
+        ):
+            self.assertEqual(send_outbox(), (0, 1))
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.attempts, 1)
+        self.assertGreater(message.next_attempt, timezone.now())
+
+    def test_claimed_batch_skipped(self):
+        """Письма, взятые другим обработчиком, повторно не отправляются"""
+        self.request_reset()
+        self.assertEqual(len(claim_batch(timezone.now(), 10)), 1)
+        self.assertEqual(send_outbox(), (0, 0))
+        self.assertEqual(len(mail.outbox), 0)
+
+
+class LoadTestReportTest(TestCase):
+    def test_parse_mix(self):
+        self.assertEqual(
+            parse_mix('browse:3, create'), {'browse': 3, 'create': 1}
+        )
+        with self.assertRaises(ValueError):
+            parse_mix('delete:1')
+
+    def test_report(self):
+        """Отчёт считает перцентили и ошибки по именам URL"""
+        self.assertEqual(percentile(list(range(1, 101)), 95), 95)
+        stats = Stats()
+        for latency in range(1, 11):
+            stats.add('index', latency / 1000, 200)
+        stats.add('index', 0.5, 500)
+        stats.add('post_create', 0.02, 'error')
+        index, post_create, total = stats.report(elapsed=1)
+        self.assertIn('index: 11 запросов', index)
+        self.assertIn('p99 500 мс', index)
+        self.assertIn('ошибок 9.1%', index)
+        self.assertIn('ошибок 100.0%', post_create)
+        self.assertIn('Всего: 12 запросов', total)
+
+
+@override_settings(PROFILE_DIR=TEMP_PROFILE_DIR, PROFILE_SAMPLE_RATE=0,
+                   PROFILE_SAMPLER_INTERVAL=0.0001, MEMORY_PROFILING=True,
+                   MEMORY_SAMPLE_RATE=0)
+class ProfilingTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_PROFILE_DIR, ignore_errors=True)
+
+    def setUp(self):
+        self.staff = get_user_model().objects.create_user(
+            username='staff', is_staff=True
+        )
+        self.client.force_login(self.staff)
+
+    def test_flag_requires_staff(self):
+        """Обычный пользователь не может включить профилирование"""
+        user = get_user_model().objects.create_user(username='user')
+        self.client.force_login(user)
+        response = self.client.get('/about/tech/?profile=cprofile')
+        self.assertNotIn('X-Profile', response)
+
+    def test_profiles_are_saved_and_reported(self):
+        """Профили сохраняются по имени URL и сводятся в отчёт"""
+        response = self.client.get('/about/tech/?profile=cprofile')
+        self.assertTrue(response['X-Profile'].startswith('about.tech/'))
+        response = self.client.get(
+            '/about/tech/', HTTP_X_PROFILE='sampler'
+        )
+        stacks_path = os.path.join(TEMP_PROFILE_DIR, response['X-Profile'])
+        self.assertTrue(stacks_path.endswith('.stacks'))
+        collapsed = os.path.join(TEMP_PROFILE_DIR, 'collapsed.txt')
+        out = StringIO()
+        call_command(
+            'profile_report', 'about:tech', collapsed=collapsed, stdout=out
+        )
+        self.assertIn('cProfile, профилей: 1', out.getvalue())
+        self.assertIn('Сэмплер, профилей: 1', out.getvalue())
+        self.assertEqual(
+            load_stacks([collapsed]), load_stacks([stacks_path])
+        )
+
+    def test_memory_profile(self):
+        """Профиль памяти сохраняется и попадает в memory_report"""
+        response = self.client.get('/about/tech/?profile=memory')
+        self.assertTrue(response['X-Profile'].endswith('.memory.json'))
+        with open(os.path.join(TEMP_PROFILE_DIR, response['X-Profile'])) as f:
+            profile = json.load(f)
+        self.assertGreater(profile['peak'], 0)
+        self.assertTrue(profile['sites'])
+        out = StringIO()
+        call_command('memory_report', 'about:tech', stdout=out)
+        self.assertIn('about:tech: запросов 1', out.getvalue())
+
+    @override_settings(MEMORY_PROFILING=False)
+    def test_memory_profiling_disabled(self):
+        """Без MEMORY_PROFILING флаг memory ничего не профилирует"""
+        response = self.client.get('/about/tech/?profile=memory')
+        self.assertNotIn('X-Profile', response)
+
+    def test_memory_peak_without_reset_peak(self):
+        """Без reset_peak (Python < 3.9) в замер не попадает старый пик"""
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+        garbage = bytearray(10 ** 7)
+        del garbage
+        with mock.patch('core.profiling.hasattr', create=True,
+                        return_value=False):
+            with MemoryTracer(1, 5) as tracer:
+                kept = bytearray(10 ** 5)
+        self.assertTrue(kept)
+        self.assertLess(tracer.peak, 10 ** 6)
+        self.assertGreater(tracer.peak, 0)
+
+
+@override_settings(METRICS_DIR=TEMP_METRICS_DIR, METRICS_FLUSH_INTERVAL=0)
+class MetricsTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_METRICS_DIR, ignore_errors=True)
+
+    def test_page_cache_and_requests_counted(self):
+        """Попадания в кэш главной и время ответов попадают в метрики"""
+        cache.clear()
+        self.addCleanup(cache.clear)
+        hit = metrics.sample_name(
+            'yatube_page_cache_requests_total',
+            result='hit', view='posts:index'
+        )
+        count = metrics.sample_name(
+            'yatube_request_duration_seconds_count', view='posts:index'
+        )
+        before = metrics.registry.collect()
+        self.client.get('/')
+        self.client.get('/')
+        after = metrics.registry.collect()
+        self.assertEqual(after[hit] - before[hit], 1)
+        self.assertEqual(after[count] - before[count], 2)
+
+    def test_metrics_sum_processes(self):
+        """/metrics складывает счётчики всех процессов"""
+        with open(os.path.join(TEMP_METRICS_DIR, '1.json'), 'w') as file:
+            json.dump({'yatube_objects_created_total{model="group"}': 5}, file)
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        content = response.content.decode()
+        self.assertIn('yatube_objects_created_total{model="group"} 5', content)
+        self.assertIn('# TYPE yatube_request_duration_seconds histogram',
+                      content)
+        self.assertIn('yatube_outbox_messages{state="pending"} 0', content)
+
+    def test_only_started_registry_writes(self):
+        """Процесс без start() (тесты, команды) не пишет файл метрик"""
+        registry = metrics.Registry()
+        registry.inc('yatube_objects_created_total', model='post')
+        self.assertFalse(os.path.exists(registry.path()))
+        self.assertEqual(registry.collect()[metrics.sample_name(
+            'yatube_objects_created_total', model='post'
+        )], 1)
+        registry.start()
+        registry.inc('yatube_objects_created_total', model='post')
+        self.assertTrue(os.path.exists(registry.path()))
+        os.remove(registry.path())
+
+    def test_start_removes_stale_files(self):
+        """Старт удаляет файлы умерших процессов и прежний файл с его pid"""
+        registry = metrics.Registry()
+        dead, alive = registry.path(2 ** 30), registry.path(1)
+        for path in (dead, alive, registry.path()):
+            with open(path, 'w') as file:
+                json.dump({}, file)
+        self.addCleanup(os.remove, alive)
+        registry.start()
+        self.assertFalse(os.path.exists(dead))
+        self.assertFalse(os.path.exists(registry.path()))
+        self.assertTrue(os.path.exists(alive))
+
+    def test_metrics_allowed_ips(self):
+        response = self.client.get('/metrics', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, HTTPStatus.FORBIDDEN)
+
+
+class CompressionMiddlewareTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_compressed_once_per_body(self):
+        """Одинаковые страницы сжимаются один раз, потом берутся из кэша"""
+        plain = self.client.get('/about/tech/')
+        self.assertNotIn('Content-Encoding', plain)
+        response = self.client.get('/about/tech/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        with mock.patch('core.compression.compress_body') as compress_body:
+            again = self.client.get(
+                '/about/tech/', HTTP_ACCEPT_ENCODING='gzip'
+            )
+        compress_body.assert_not_called()
+        self.assertEqual(again.content, response.content)
+
+    def test_csrf_page_padded(self):
+        """Страница с токеном CSRF сжимается gzip со случайной добавкой"""
+        response = self.client.get(
+            '/auth/login/', HTTP_ACCEPT_ENCODING='br, gzip'
+        )
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertTrue(response.content[3] & gzip.FNAME)
+        self.assertIn(b'csrfmiddlewaretoken', gzip.decompress(
+            response.content
+        ))
@@ -0,0 +1,128 @@
+import logging
+import time
+from functools import wraps
+from http import HTTPStatus
+
+from django.conf import settings
+from django.core.cache import cache
+from django.shortcuts import render
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'10/m' → (10, 60): сколько запросов и за сколько секунд."""
+    count, _, period = rate.partition('/')
+
+    return int(count), PERIODS[period[0]]
+
+
+def bucket(key, rate, now):
+    """Ключ счётчика корзины, её лимит, период и секунды до пополнения.
+
+    Корзина на rate запросов пополняется целиком раз в период; счётчик
+    живёт в кэше, база не трогается.
+    """
+    limit, period = parse_rate(rate)
+    window = int(now // period)
+
+    return (
+        f'throttle:{key}:{window}', limit, period,
+        max(1, int((window + 1) * period - now)),
+    )
+
+
+def take_tokens(buckets, now):
+    """Забирает по токену из каждой корзины.
+
+    Возвращает None или (ключ пустой корзины, секунды до пополнения).
+    Сначала проверяются все корзины: запрос, отклонённый по одной,
+    не тратит токены остальных (например, лимит пользователя не
+    расходуется, пока его IP заблокирован).
+    """
+    states = [bucket(key, rate, now) for key, rate in buckets]
+    for key, limit, period, retry_after in states:
+        if cache.get(key, 0) >= limit:
+            return key, retry_after
+    denied = None
+    for key, limit, period, retry_after in states:
+        cache.add(key, 0, period)
+        try:
+            used = cache.incr(key)
+        except ValueError:
+            # Ключ вытеснен между add и incr — считаем запрос первым
+            cache.set(key, 1, period)
+            used = 1
+        # Параллельный запрос мог забрать последний токен после проверки
+        if used > limit and denied is None:
+            denied = key, retry_after
+
+    return denied
+
+
+def client_ip(request):
+    """Адрес клиента для лимитов по IP.
+
+    За обратным прокси (nginx) REMOTE_ADDR у всех запросов один — адрес
+    прокси, и лимит по IP стал бы общим на весь сайт. Если запрос пришёл
+    от адреса из THROTTLE_TRUSTED_PROXIES, клиентом считается последний
+    адрес X-Forwarded-For, не принадлежащий доверенным прокси: адреса
+    левее мог подставить сам клиент.
+    """
+    ip = request.META.get('REMOTE_ADDR', '')
+    trusted = settings.THROTTLE_TRUSTED_PROXIES
+    if ip not in trusted:
+        return ip
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+    for address in reversed(forwarded.split(',')):
+        address = address.strip()
+        if address and address not in trusted:
+            return address
+
+    return ip
+
+
+def throttle(scope, methods=('POST',)):
+    """Ограничивает частоту запросов к view по пользователю и по IP.
+
+    Лимиты берутся из THROTTLE_RATES[scope]; при превышении отвечает
+    429 с заголовком Retry-After.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            rates = settings.THROTTLE_RATES.get(scope, {})
+            if request.method not in methods or not rates:
+                return view(request, *args, **kwargs)
+            now = time.time()
+            buckets = []
+            if request.user.is_authenticated and 'user' in rates:
+                buckets.append(
+                    (f'{scope}:user:{request.user.pk}', rates['user'])
+                )
+            if 'ip' in rates:
+                buckets.append(
+                    (f'{scope}:ip:{client_ip(request)}', rates['ip'])
+                )
+            denied = take_tokens(buckets, now)
+            if denied is None:
+                return view(request, *args, **kwargs)
+            key, retry_after = denied
+
+            metrics.inc('yatube_throttled_total', scope=scope)
+            logger.warning('Запрос к %s ограничен: %s', scope, key)
+            response = render(
+                request, 'core/429.html', {'retry_after': retry_after},
+                status=HTTPStatus.TOO_MANY_REQUESTS
+            )
+            response['Retry-After'] = retry_after
+
+            return response
+
+        return wrapper
+
+    return decorator
@@ -1,4 +1,28 @@
+import mimetypes
+import os
+from http import HTTPStatus
+
+from django.conf import settings
+from django.core.exceptions import (
+    PermissionDenied, SuspiciousFileOperation
+)
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseNotModified,
+    StreamingHttpResponse
+)
 from django.shortcuts import render
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+from sorl.thumbnail.conf import settings as thumbnail_settings
+
+from posts.storage import is_hashed_name
+
+from . import metrics as process_metrics
+from .middleware import FOREVER
+from .models import OutboxMessage
+
+THUMBNAIL_PREFIX = thumbnail_settings.THUMBNAIL_PREFIX
 
 
 def page_not_found(request, exception):
@@ -11,3 +35,143 @@ def permission_denied_view(request, exception):
 
 def internal_server_error(request):
     return render(request, 'core/500.html', status=500)
+
+
+def _parse_range(header, size):
+    """Границы запрошенного диапазона байт или None.
+
+    Поддерживается один диапазон: «bytes=start-end», «bytes=start-»
+    и «bytes=-suffix». Для неудовлетворимого диапазона возвращается
+    пустой кортеж.
+    """
+    unit, _, byte_range = header.partition('=')
+    if unit.strip() != 'bytes' or ',' in byte_range:
+        return None
+    start, _, end = byte_range.strip().partition('-')
+    try:
+        if not start:
+            suffix = int(end)
+            if suffix <= 0:
+                return ()
+            return max(size - suffix, 0), size - 1
+        start = int(start)
+        end = int(end) if end else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return ()
+
+    return start, min(end, size - 1)
+
+
+def _file_chunks(path, start, length, chunk_size=64 * 1024):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _sendfile_response(backend, path, full_path, content_type):
+    """Пустой ответ, тело которого отдаст фронтовый сервер."""
+    response = HttpResponse(content_type=content_type)
+    if backend == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = (
+            settings.MEDIA_ACCEL_REDIRECT_PREFIX + path
+        )
+    else:
+        response['X-Sendfile'] = full_path
+
+    return response
+
+
+def _file_response(request, full_path, size, content_type):
+    """Файл целиком или запрошенный заголовком Range диапазон."""
+    byte_range = _parse_range(request.META.get('HTTP_RANGE', ''), size)
+    if byte_range == ():
+        response = HttpResponse(
+            status=HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+        )
+        response['Accept-Ranges'] = 'bytes'
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if not byte_range:
+        return FileResponse(open(full_path, 'rb'), content_type=content_type)
+    start, end = byte_range
+    response = StreamingHttpResponse(
+        _file_chunks(full_path, start, end - start + 1),
+        status=HTTPStatus.PARTIAL_CONTENT,
+        content_type=content_type,
+    )
+    response['Content-Length'] = end - start + 1
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    return response
+
+
+def serve_media(request, path):
+    """Отдаёт загруженные пользователями файлы из MEDIA_ROOT.
+
+    Поддерживает If-Modified-Since и Range. Целиком файл отдаётся через
+    FileResponse (WSGI-сервер может использовать sendfile), а при
+    MEDIA_SENDFILE_BACKEND передача поручается фронтовому серверу.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+    stat = os.stat(full_path)
+    if not was_modified_since(
+        request.META.get('HTTP_IF_MODIFIED_SINCE'),
+        stat.st_mtime, stat.st_size
+    ):
+        return HttpResponseNotModified()
+
+    content_type = (
+        mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    )
+    backend = settings.MEDIA_SENDFILE_BACKEND
+    if backend:
+        response = _sendfile_response(backend, path, full_path, content_type)
+    else:
+        response = _file_response(
+            request, full_path, stat.st_size, content_type
+        )
+        if response.status_code == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE:
+            return response
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if path.startswith(THUMBNAIL_PREFIX) or is_hashed_name(path):
+        # Имя миниатюры sorl выводится из исходника и параметров, а имя
+        # картинки поста — хэш её содержимого, поэтому файл по этому
+        # адресу никогда не меняется
+        response['Cache-Control'] = FOREVER
+    else:
+        response['Cache-Control'] = 'public, max-age=86400'
+
+    return response
+
+
+def metrics(request):
+    """Метрики всех процессов сервера в формате Prometheus"""
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise PermissionDenied
+    totals = process_metrics.registry.collect()
+    # Очередь общая для всех процессов, поэтому её не суммируют
+    unsent = OutboxMessage.objects.filter(sent__isnull=True)
+    failed = unsent.filter(attempts__gte=settings.OUTBOX_MAX_ATTEMPTS).count()
+    for state, count in (('pending', unsent.count() - failed),
+                         ('failed', failed)):
+        totals[process_metrics.sample_name(
+            'yatube_outbox_messages', state=state
+        )] = count
+
+    return HttpResponse(
+        process_metrics.exposition(totals),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
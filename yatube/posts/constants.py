@@ -1,3 +1,41 @@
 NUMBER_OF_POSTS = 10
 NUMBER_OF_SYMBOLS = 15
 NUMBER_OF_SYMBOLS_2ND_PAGE = 3
+# Миниатюры картинок в ленте и на странице поста
+# (должны совпадать с параметрами {% thumbnail %} в шаблонах)
+THUMBNAIL_GEOMETRY = '960x339'
+THUMBNAIL_OPTIONS = {'crop': 'center', 'upscale': True}
+# Файл картинки моложе стольких секунд не удаляется сразу после
+# удаления поста: его может переиспользовать пост, который ещё не
+# сохранён (такие файлы позже уберёт gc_media)
+IMAGE_RELEASE_MIN_AGE = 60 * 10
+# Больше групп — вместо выпадающего списка поле с автодополнением
+GROUP_SELECT_LIMIT = 100
+GROUP_AUTOCOMPLETE_LIMIT = 10
+# Сколько секунд хранятся в кэше список групп, их число и результаты
+# поиска (при изменении групп сменяется версия, старые записи истекают)
+GROUP_CACHE_TIMEOUT = 60 * 60
+# Длина отрывка текста поста в ленте
+EXCERPT_LENGTH = 300
+# Сколько секунд хранится в кэше порция ленты для бесконечной прокрутки
+FRAGMENT_CACHE_TIMEOUT = 300
+# Сколько секунд хранится в кэше список авторов, на которых подписан
+# пользователь (сбрасывается при подписке и отписке)
+FOLLOWED_IDS_TIMEOUT = 60 * 60 * 24
+# Сколько человек на странице подписчиков и подписок
+FOLLOWS_PER_PAGE = 20
+# Рекомендации авторов: сколько хранить на пользователя и сколько
+# показывать; вес совместных подписок относительно друзей друзей
+# и сколько подписчиков автора учитывать при их подсчёте
+RECOMMENDATIONS_PER_USER = 20
+RECOMMENDATIONS_SHOWN = 5
+COFOLLOW_WEIGHT = 0.5
+COFOLLOW_SAMPLE = 50
+# Популярное: за сколько секунд вклад события падает вдвое, веса
+# публикации и комментария, сколько лучших постов хранить в кэше
+# и как долго (время ограничивает расхождение кэша с базой)
+POPULAR_HALF_LIFE = 60 * 60 * 24
+POPULAR_POST_WEIGHT = 1
+POPULAR_COMMENT_WEIGHT = 3
+POPULAR_SIZE = 100
+POPULAR_CACHE_TIMEOUT = 60 * 10
@@ -0,0 +1,126 @@
+from django.core.paginator import Page, Paginator
+
+from .models import Post
+
+
+class FeedAuthor:
+    """Автор поста в ленте: только то, что нужно карточке."""
+    __slots__ = ('pk', 'username', 'first_name', 'last_name')
+
+    def __init__(self, pk, username, first_name, last_name):
+        self.pk = pk
+        self.username = username
+        self.first_name = first_name
+        self.last_name = last_name
+
+    def __str__(self):
+        return self.username
+
+    def __eq__(self, other):
+        return getattr(other, 'pk', None) == self.pk
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    def get_full_name(self):
+        return f'{self.first_name} {self.last_name}'.strip()
+
+
+class FeedGroup:
+    """Группа поста в ленте."""
+    __slots__ = ('pk', 'slug', 'title')
+
+    def __init__(self, pk, slug, title):
+        self.pk = pk
+        self.slug = slug
+        self.title = title
+
+    def __str__(self):
+        return self.title
+
+    def __eq__(self, other):
+        return getattr(other, 'pk', None) == self.pk
+
+    def __hash__(self):
+        return hash(self.pk)
+
+
+class FeedItem:
+    """Пост в ленте, собранный из кортежа values_list вместо модели.
+
+    С постом сравнивается по pk. Полный текст не загружается вместе
+    с лентой: при первом обращении он одним запросом читается для всех
+    постов той же страницы (см. feed_items).
+    """
+    __slots__ = (
+        'pk', 'pub_date', 'excerpt_html', 'excerpt_truncated',
+        'image', 'image_width', 'image_height', 'author', 'group',
+        '_text', '_page',
+    )
+    # FieldFile с хранилищем поля: sorl учитывает его в ключе миниатюры
+    image_field = Post._meta.get_field('image')
+
+    FIELDS = (
+        'pk', 'pub_date', 'excerpt_html', 'excerpt_truncated',
+        'image', 'image_width', 'image_height',
+        'author_id', 'author__username',
+        'author__first_name', 'author__last_name',
+        'group_id', 'group__slug', 'group__title',
+    )
+
+    def __init__(self, row):
+        (self.pk, self.pub_date, self.excerpt_html, self.excerpt_truncated,
+         image, self.image_width, self.image_height,
+         author_id, username, first_name, last_name,
+         group_id, slug, title) = row
+        field = self.image_field
+        self.image = field.attr_class(None, field, image)
+        self._text = None
+        self._page = (self,)
+        self.author = FeedAuthor(author_id, username, first_name, last_name)
+        self.group = None
+        if group_id is not None:
+            self.group = FeedGroup(group_id, slug, title)
+
+    @property
+    def id(self):
+        return self.pk
+
+    @property
+    def text(self):
+        if self._text is None:
+            items = {item.pk: item for item in self._page}
+            for pk, text in Post.objects.filter(pk__in=items).values_list(
+                'pk', 'text'
+            ):
+                items[pk]._text = text
+        return self._text
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, (FeedItem, Post)) and other.pk == self.pk
+        )
+
+    def __hash__(self):
+        return hash(self.pk)
+
+
+def feed_items(rows):
+    """FeedItem из строк values_list, с общей загрузкой текста."""
+    items = list(map(FeedItem, rows))
+    page = tuple(items)
+    for item in items:
+        item._page = page
+
+    return items
+
+
+class FeedPaginator(Paginator):
+    """Пагинатор, отдающий страницу из FeedItem вместо моделей."""
+
+    def __init__(self, posts, per_page, **kwargs):
+        super().__init__(posts.values_list(*FeedItem.FIELDS), per_page,
+                         **kwargs)
+
+    def _get_page(self, object_list, number, paginator):
+        return Page(feed_items(object_list), number, paginator)
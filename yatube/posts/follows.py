@@ -0,0 +1,102 @@
+from array import array
+from bisect import bisect_left
+
+from django.core.cache import cache
+
+from .constants import FOLLOWED_IDS_TIMEOUT, FOLLOWS_PER_PAGE
+from .feed import FeedAuthor
+from .models import Follow
+
+# Список: (поле владельца списка в Follow, поле человека в списке)
+FOLLOW_LISTS = {
+    'followers': ('author', 'user'),
+    'following': ('user', 'author'),
+}
+
+
+def followed_key(user_id):
+    return f'followed_ids:{user_id}'
+
+
+def followed_ids(user):
+    """Отсортированный массив id авторов, на которых подписан user.
+
+    Хранится в кэше компактным массивом и запоминается на объекте
+    пользователя, так что за запрос читается не больше одного раза.
+    """
+    if not user.is_authenticated:
+        return array('I')
+    ids = getattr(user, '_followed_ids', None)
+    if ids is None:
+        ids = array('I')
+        data = cache.get(followed_key(user.pk))
+        if data is None:
+            ids.extend(Follow.objects.filter(user=user).order_by(
+                'author_id'
+            ).values_list('author_id', flat=True))
+            cache.set(
+                followed_key(user.pk), ids.tobytes(), FOLLOWED_IDS_TIMEOUT
+            )
+        else:
+            ids.frombytes(data)
+        user._followed_ids = ids
+
+    return ids
+
+
+def is_following(user, author_id):
+    ids = followed_ids(user)
+    index = bisect_left(ids, author_id)
+
+    return index < len(ids) and ids[index] == author_id
+
+
+def invalidate_followed(user_id):
+    cache.delete(followed_key(user_id))
+
+
+def follow_page(owner, kind, cursor=None):
+    """Подписчики или подписки owner после курсора (id записи Follow).
+
+    Возвращает людей страницы и курсор следующей. Выборка по ключу
+    (владелец, id), поэтому стоимость страницы не зависит от её номера.
+    """
+    owner_field, person_field = FOLLOW_LISTS[kind]
+    follows = Follow.objects.filter(**{owner_field: owner}).order_by('-id')
+    if cursor:
+        follows = follows.filter(id__lt=cursor)
+    rows = list(follows.values_list(
+        'id', person_field, f'{person_field}__username',
+        f'{person_field}__first_name', f'{person_field}__last_name',
+    )[:FOLLOWS_PER_PAGE + 1])
+    next_cursor = None
+    if len(rows) > FOLLOWS_PER_PAGE:
+        rows = rows[:FOLLOWS_PER_PAGE]
+        next_cursor = rows[-1][0]
+
+    return [FeedAuthor(*row[1:]) for row in rows], next_cursor
+
+
+def relations(viewer, people):
+    """Отношение viewer к людям страницы по pk: mutual, follows_you, followed.
+
+    Подписки viewer проверяются по массиву из кэша, подписчики — одним
+    запросом только по людям страницы, а не по всем подписчикам viewer.
+    """
+    if not viewer.is_authenticated or not people:
+        return {}
+    ids = {person.pk for person in people}
+    followed = {pk for pk in ids if is_following(viewer, pk)}
+    follows_viewer = set(Follow.objects.filter(
+        author=viewer, user_id__in=ids
+    ).values_list('user_id', flat=True))
+    relation = {}
+    for pk in followed | follows_viewer:
+        if pk in followed and pk in follows_viewer:
+            relation[pk] = 'mutual'
+        elif pk in follows_viewer:
+            relation[pk] = 'follows_you'
+        else:
+            relation[pk] = 'followed'
+
+    return relation
@@ -1,14 +1,78 @@
 from django import forms
+from django.db.models.fields.files import FieldFile
+from django.urls import reverse_lazy
+from django.utils.html import format_html
 
+from .constants import GROUP_SELECT_LIMIT
+from .groups import group_choices, group_count
+from .images import normalize_image
 from .models import Post, Comment
 
 
+class GroupAutocompleteWidget(forms.TextInput):
+    """Поле для слага группы с подсказками с сервера"""
+    autocomplete_url = reverse_lazy('posts:group_autocomplete')
+    script = (
+        '<script>(function () {{'
+        'var input = document.getElementById("{2}");'
+        'var list = document.getElementById("{1}");'
+        'input.addEventListener("input", function () {{'
+        'fetch("{3}?q=" + encodeURIComponent(input.value))'
+        '.then(function (response) {{ return response.json(); }})'
+        '.then(function (data) {{'
+        'list.innerHTML = "";'
+        'data.results.forEach(function (group) {{'
+        'var option = document.createElement("option");'
+        'option.value = group.slug; option.textContent = group.title;'
+        'list.appendChild(option);'
+        '}}); }}); }}); }})();</script>'
+    )
+
+    def render(self, name, value, attrs=None, renderer=None):
+        attrs = dict(attrs or {})
+        input_id = attrs.get('id', f'id_{name}')
+        attrs['list'] = list_id = f'{input_id}_options'
+        attrs['autocomplete'] = 'off'
+        return format_html(
+            '{0}<datalist id="{1}"></datalist>' + self.script,
+            super().render(name, value, attrs, renderer),
+            list_id, input_id, self.autocomplete_url,
+        )
+
+
 class PostForm(forms.ModelForm):
     """Форма постов"""
     class Meta:
         model = Post
         fields = ('text', 'group', 'image')
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Список групп берётся из кэша, а не запросом при каждом рендере
+        group_field = self.fields['group']
+        if group_count() > GROUP_SELECT_LIMIT:
+            group_field.to_field_name = 'slug'
+            group_field.widget = GroupAutocompleteWidget()
+            group_field.help_text = 'Начните вводить название группы'
+            # model_to_dict даёт pk группы, а поле теперь ждёт слаг
+            group_id = self.initial.get('group')
+            if group_id is not None and group_id == self.instance.group_id:
+                self.initial['group'] = self.instance.group.slug
+        else:
+            group_field.widget.choices = [('', group_field.empty_label)] + [
+                (pk, title) for pk, slug, title in group_choices()
+            ]
+
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if not image:
+            self.instance.image_width = self.instance.image_height = None
+        elif not isinstance(image, FieldFile):
+            image, size = normalize_image(image)
+            self.instance.image_width, self.instance.image_height = size
+
+        return image
+
 
 class CommentForm(forms.ModelForm):
     """Форма комментариев"""
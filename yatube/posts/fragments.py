@@ -0,0 +1,178 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db.models import Q
+from django.http import Http404, HttpResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
+
+from .constants import FRAGMENT_CACHE_TIMEOUT, NUMBER_OF_POSTS
+from .feed import FeedItem, feed_items
+from .models import Post, User
+
+logger = logging.getLogger(__name__)
+_pending = threading.local()
+
+FEED_VERSION_KEY = 'feed_version'
+# Фрагменты, в карточках которых нет ссылки на группу
+LINKLESS_FRAGMENTS = {'posts:group_list_fragment', 'posts:profile_fragment'}
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def feed_version():
+    """Текущая версия лент; меняется при изменении постов и подписок."""
+    return cache.get_or_set(FEED_VERSION_KEY, time.time_ns, None)
+
+
+def invalidate_feeds():
+    cache.set(FEED_VERSION_KEY, time.time_ns(), None)
+
+
+def encode_cursor(post):
+    """Курсор после поста: время публикации в микросекундах и pk."""
+    return f'{(post.pub_date - EPOCH) // MICROSECOND}-{post.pk}'
+
+
+def decode_cursor(value):
+    try:
+        microseconds, pk = map(int, value.split('-'))
+    except ValueError:
+        raise Http404('Неверный курсор')
+
+    return EPOCH + microseconds * MICROSECOND, pk
+
+
+def feed_batch(posts, cursor):
+    """Порция ленты после курсора и курсор следующей порции.
+
+    Выборка по ключу (pub_date, pk), а не по номеру страницы: база не
+    пропускает OFFSET строк, и новые посты не сдвигают уже открытые порции.
+    """
+    posts = posts.order_by('-pub_date', '-pk')
+    if cursor:
+        pub_date, pk = decode_cursor(cursor)
+        posts = posts.filter(
+            Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk)
+        )
+    items = feed_items(
+        posts.values_list(*FeedItem.FIELDS)[:NUMBER_OF_POSTS + 1]
+    )
+    next_cursor = None
+    if len(items) > NUMBER_OF_POSTS:
+        items = items[:NUMBER_OF_POSTS]
+        next_cursor = encode_cursor(items[-1])
+
+    return items, next_cursor
+
+
+def feed_posts(url_name, user, *args):
+    """Посты ленты фрагмента url_name; args — аргументы его URL."""
+    if url_name == 'posts:group_list_fragment':
+        return Post.objects.filter(group__slug=args[0])
+    if url_name == 'posts:profile_fragment':
+        return Post.objects.filter(author__username=args[0])
+    if url_name == 'posts:follow_index_fragment':
+        return Post.objects.filter(author__following__user=user)
+
+    return Post.objects.all()
+
+
+class Fragment:
+    """Порция ленты в виде HTML карточек постов, с кэшем по курсору.
+
+    Адрес фрагмента без курсора — ключ кэша. Карточки показывают
+    подписки читателя, поэтому для вошедшего пользователя порции
+    кэшируются отдельно.
+    """
+    def __init__(self, url_name, args, user):
+        self.url_name = url_name
+        self.args = tuple(args)
+        self.user = user
+        self.url = reverse(url_name, args=self.args)
+        self.show_link = url_name not in LINKLESS_FRAGMENTS
+        user_key = user.pk if user.is_authenticated else ''
+        self.key = f'feed_fragment:{user_key}:{self.url}'
+
+    def next_url(self, cursor):
+        return f'{self.url}?cursor={cursor}' if cursor else ''
+
+    def get(self, cursor):
+        """HTML порции после cursor и курсор следующей порции."""
+        key = f'{self.key}:{cursor}'
+        version = feed_version()
+        cached = cache.get(key, version=version)
+        if cached is None:
+            items, next_cursor = feed_batch(
+                feed_posts(self.url_name, self.user, *self.args), cursor
+            )
+            html = render_to_string('posts/includes/feed_fragment.html', {
+                'posts': items,
+                'user': self.user,
+                'show_link': self.show_link,
+                'next_url': self.next_url(next_cursor),
+            })
+            cached = html, next_cursor
+            cache.set(key, cached, FRAGMENT_CACHE_TIMEOUT, version=version)
+
+        return cached
+
+    def warm_later(self, cursor):
+        """Готовит порцию после cursor, когда ответ уже отправлен.
+
+        Запоминается только адрес, пользователь и курсор: ответ может
+        попасть в cache_page, и на нём не должно быть ничего, что
+        потащит за собой запросы при сериализации. Порцию рендерит
+        warm_pending по сигналу request_finished — после отправки тела,
+        но тем же обработчиком: до конца прогрева он не берёт следующий
+        запрос. Вынести прогрев в отдельный процесс нельзя, пока кэш —
+        LocMemCache в памяти процесса сервера.
+        """
+        if cursor:
+            if not hasattr(_pending, 'fragments'):
+                _pending.fragments = []
+            user_id = self.user.pk if self.user.is_authenticated else None
+            _pending.fragments.append(
+                (self.url_name, self.args, user_id, cursor)
+            )
+
+    def response(self, cursor):
+        html, next_cursor = self.get(cursor)
+        response = HttpResponse(html)
+        if next_cursor:
+            response['X-Next-Cursor'] = next_cursor
+        self.warm_later(next_cursor)
+
+        return response
+
+
+def forget_pending():
+    _pending.fragments = []
+
+
+def warm_pending():
+    """Рендерит порции, отложенные warm_later в этом потоке."""
+    pending = getattr(_pending, 'fragments', [])
+    forget_pending()
+    for url_name, args, user_id, cursor in pending:
+        try:
+            user = AnonymousUser()
+            if user_id is not None:
+                user = User.objects.get(pk=user_id)
+            Fragment(url_name, args, user).get(cursor)
+        except Exception:
+            logger.exception('Не удалось прогреть %s %s', url_name, args)
+
+
+def page_fragment(request, url_name, args, page_obj):
+    """Фрагмент, продолжающий страницу page_obj, и курсор после неё."""
+    fragment = Fragment(url_name, args, request.user)
+    cursor = None
+    if page_obj.has_next():
+        cursor = encode_cursor(page_obj[len(page_obj) - 1])
+
+    return fragment, cursor
@@ -0,0 +1,78 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db.models import Q
+
+from .constants import GROUP_AUTOCOMPLETE_LIMIT, GROUP_CACHE_TIMEOUT
+from .models import Group
+
+GROUPS_VERSION_KEY = 'groups_version'
+
+
+def groups_version():
+    """Текущая версия списка групп; меняется при любом изменении групп."""
+    return cache.get_or_set(GROUPS_VERSION_KEY, time.time_ns, None)
+
+
+def invalidate_groups():
+    cache.set(GROUPS_VERSION_KEY, time.time_ns(), None)
+
+
+def group_choices():
+    """Список (id, slug, title) всех групп из кэша."""
+    version = groups_version()
+    choices = cache.get('group_choices', version=version)
+    if choices is None:
+        choices = list(
+            Group.objects.order_by('title').values_list('id', 'slug', 'title')
+        )
+        cache.set(
+            'group_choices', choices, GROUP_CACHE_TIMEOUT, version=version
+        )
+
+    return choices
+
+
+def group_count():
+    """Число групп из кэша, без загрузки самого списка."""
+    return cache.get_or_set(
+        'group_count', Group.objects.count, GROUP_CACHE_TIMEOUT,
+        version=groups_version(),
+    )
+
+
+def prefix_range(field, prefix):
+    """Условие «field начинается с prefix» в виде диапазона.
+
+    В отличие от __startswith (LIKE, на SQLite ещё и без учёта регистра)
+    диапазон обслуживается индексом поля.
+    """
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix + '\uffff'})
+
+
+def search_groups(query):
+    """Группы, у которых название или слаг начинаются с query.
+
+    Название сравнивается с учётом регистра, поэтому ищется и вариант
+    query с заглавной первой буквой; слаг — в нижнем регистре.
+    """
+    query = query.strip()
+    if not query:
+        return []
+    digest = hashlib.md5(query.encode()).hexdigest()
+    key = f'group_search:{digest}'
+    version = groups_version()
+    groups = cache.get(key, version=version)
+    if groups is None:
+        condition = prefix_range('slug', query.lower())
+        for title in {query, query[:1].upper() + query[1:]}:
+            condition |= prefix_range('title', title)
+        groups = list(
+            Group.objects.filter(condition).order_by('title').values(
+                'slug', 'title'
+            )[:GROUP_AUTOCOMPLETE_LIMIT]
+        )
+        cache.set(key, groups, GROUP_CACHE_TIMEOUT, version=version)
+
+    return groups
@@ -0,0 +1,59 @@
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps
+
+# Форматы, которые пересжимаются без потерь функциональности;
+# GIF может быть анимированным, поэтому хранится как есть
+REENCODED_FORMATS = {
+    'JPEG': {'quality': 85, 'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': 85, 'method': 6},
+}
+# Метаданные, которые Pillow переносит из info в сохранённый файл
+METADATA_KEYS = ('exif', 'xmp', 'XML:com.adobe.xmp', 'comment')
+
+
+def normalize_image(file):
+    """Готовит загруженную картинку поста к хранению.
+
+    Размеры проверяются по заголовку, без декодирования. Картинки
+    с EXIF или больше POST_IMAGE_MAX_SIZE поворачиваются по EXIF-ориентации,
+    уменьшаются и пересжимаются без метаданных; остальные сохраняются
+    как есть. Возвращает файл и его итоговые размеры.
+    """
+    file.seek(0)
+    image = Image.open(file)
+    width, height = image.size
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Слишком большое изображение: %(width)s×%(height)s',
+            code='image_too_large',
+            params={'width': width, 'height': height},
+        )
+    max_size = settings.POST_IMAGE_MAX_SIZE
+    image_format = image.format
+    oversized = max(width, height) > max_size
+    if image_format not in REENCODED_FORMATS or not (
+        oversized or 'exif' in image.info
+    ):
+        file.seek(0)
+        return file, (width, height)
+
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+    for key in METADATA_KEYS:
+        image.info.pop(key, None)
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L', 'CMYK'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(
+        buffer, image_format, exif=b'', **REENCODED_FORMATS[image_format]
+    )
+    normalized = SimpleUploadedFile(
+        file.name, buffer.getvalue(), Image.MIME[image_format]
+    )
+
+    return normalized, image.size
@@ -0,0 +1,56 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.feed import FeedItem
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает память и время сборки ленты из моделей и из FeedItem'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, default=1000,
+            help='Сколько постов загружать за раз',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=10,
+            help='Сколько раз повторять замер времени',
+        )
+
+    def models(self, rows):
+        return list(Post.objects.select_related(
+            'group', 'author'
+        ).defer('text')[:rows])
+
+    def items(self, rows):
+        return list(map(
+            FeedItem, Post.objects.values_list(*FeedItem.FIELDS)[:rows]
+        ))
+
+    def measure(self, build, rows, repeat):
+        tracemalloc.start()
+        posts = build(rows)
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            build(rows)
+        average = (time.perf_counter() - start) / repeat
+
+        return len(posts), size, average
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        if not Post.objects.exists():
+            raise CommandError('В базе нет постов для замера')
+        for name, build in (('Модели', self.models),
+                            ('FeedItem', self.items)):
+            count, size, average = self.measure(build, rows, repeat)
+            self.stdout.write(
+                f'{name}: {count} постов, {size / 1024:.1f} КиБ '
+                f'({size / count:.0f} байт на пост), '
+                f'{average * 1000:.2f} мс на выборку'
+            )
@@ -0,0 +1,154 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from sorl.thumbnail import default
+from sorl.thumbnail import delete as delete_thumbnails
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore
+
+from posts.models import Post
+
+CHUNK_SIZE = 500
+
+
+def walk_sorted(root, prefix, modified_before):
+    """Файлы каталога в лексикографическом порядке полных имён.
+
+    Каталог сортируется как имя с «/» на конце — так порядок обхода
+    совпадает с порядком сортировки строк в базе. Файлы, изменённые
+    после modified_before, пропускаются: их пост может ещё сохраняться.
+    """
+    try:
+        entries = list(os.scandir(root))
+    except FileNotFoundError:
+        return
+    entries.sort(key=lambda entry: entry.name + '/' * entry.is_dir())
+    for entry in entries:
+        name = prefix + entry.name
+        if entry.is_dir():
+            yield from walk_sorted(entry.path, name + '/', modified_before)
+            continue
+        stat = entry.stat()
+        if stat.st_mtime < modified_before:
+            yield name, stat.st_size
+
+
+def referenced_images():
+    """Имена картинок постов в порядке сортировки."""
+    return Post.objects.exclude(image='').order_by('image').values_list(
+        'image', flat=True
+    ).distinct().iterator()
+
+
+def check_order():
+    """Проверяет, что база сортирует имена побайтно, как файлы на диске.
+
+    Выполняется до удаления: иначе расхождение обнаружится, когда часть
+    файлов с живыми ссылками уже может быть удалена.
+    """
+    previous = ''
+    for name in referenced_images():
+        if name < previous:
+            raise CommandError(
+                'База сортирует имена файлов не побайтно, '
+                'сравнение с файлами на диске невозможно'
+            )
+        previous = name
+
+
+def unreferenced(files, references):
+    """Файлы из отсортированного потока, которых нет среди ссылок."""
+    reference = next(references, None)
+    for name, size in files:
+        while reference is not None and reference < name:
+            reference = next(references, None)
+        if reference != name:
+            yield name, size
+
+
+def chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет картинки постов и миниатюры sorl-thumbnail, '
+        'на которые больше ничто не ссылается'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено',
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='Не трогать файлы моложе стольких секунд',
+        )
+        parser.add_argument(
+            '--rate', type=float, default=0,
+            help='Не больше стольких удалений в секунду (0 — без ограничения)',
+        )
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.delay = 1 / options['rate'] if options['rate'] else 0
+        self.count = self.reclaimed = 0
+        modified_before = time.time() - options['min_age']
+        check_order()
+        field = Post._meta.get_field('image')
+        upload_dir = field.upload_to.rstrip('/')
+        originals = walk_sorted(
+            os.path.join(settings.MEDIA_ROOT, upload_dir), upload_dir + '/',
+            modified_before
+        )
+        for name, size in unreferenced(originals, referenced_images()):
+            self.remove(
+                name, size,
+                lambda: delete_thumbnails(ImageFile(name, field.storage))
+            )
+
+        thumbnail_dir = thumbnail_settings.THUMBNAIL_PREFIX.rstrip('/')
+        thumbnails = walk_sorted(
+            os.path.join(settings.MEDIA_ROOT, thumbnail_dir),
+            thumbnail_dir + '/', modified_before
+        )
+        for chunk in chunks(thumbnails, CHUNK_SIZE):
+            keys = {
+                add_prefix(ImageFile(name, default.storage).key): (name, size)
+                for name, size in chunk
+            }
+            known = set(KVStore.objects.filter(
+                key__in=list(keys)
+            ).values_list('key', flat=True))
+            for key, (name, size) in keys.items():
+                if key not in known:
+                    self.remove(
+                        name, size, lambda: default.storage.delete(name)
+                    )
+
+        action = 'Можно освободить' if self.dry_run else 'Освобождено'
+        self.stdout.write(
+            f'{action}: {self.reclaimed} байт в {self.count} файлах'
+        )
+
+    def remove(self, name, size, delete):
+        self.count += 1
+        self.reclaimed += size
+        self.stdout.write(f'{name} ({size} байт)')
+        if self.dry_run:
+            return
+        delete()
+        if self.delay:
+            time.sleep(self.delay)
@@ -0,0 +1,48 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from posts.constants import POPULAR_COMMENT_WEIGHT, POPULAR_POST_WEIGHT
+from posts.models import Comment, Group, Post
+from posts.popular import event_score, log_add, ranking_key
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает популярность постов с нуля: после миграции '
+        'или смены весов и периода полураспада'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        posts = Post.objects.order_by('pk').only('pk', 'pub_date')
+        last_pk = 0
+        total = 0
+        while True:
+            batch = list(
+                posts.filter(pk__gt=last_pk)[:options['batch_size']]
+            )
+            if not batch:
+                break
+            scores = {
+                post.pk: event_score(POPULAR_POST_WEIGHT, post.pub_date)
+                for post in batch
+            }
+            for post_id, created in Comment.objects.filter(
+                post_id__in=scores
+            ).values_list('post_id', 'created'):
+                scores[post_id] = log_add(
+                    scores[post_id],
+                    event_score(POPULAR_COMMENT_WEIGHT, created)
+                )
+            for post in batch:
+                post.popularity = scores[post.pk]
+            Post.objects.bulk_update(batch, ['popularity'])
+            last_pk = batch[-1].pk
+            total += len(batch)
+            self.stdout.write(f'Постов: {total}')
+        group_ids = Group.objects.values_list('pk', flat=True)
+        cache.delete_many(
+            [ranking_key(None)] + [ranking_key(pk) for pk in group_ids]
+        )
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts.models import Follow, FollowChange, Recommendation
+from posts.recommendations import affected_users, load_graphs, rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает рекомендации «на кого подписаться»: по умолчанию '
+        'только для пользователей, чьё окружение изменилось'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересчитать для всех; нужно изредка, чтобы учесть '
+                 'дальние изменения совместных подписок',
+        )
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        start = time.perf_counter()
+        changes = FollowChange.objects.filter(changed__lte=started)
+        following, followers = load_graphs()
+        if options['full']:
+            users = set(following)
+            # У отписавшихся от всех рекомендаций больше нет
+            Recommendation.objects.exclude(
+                user_id__in=Follow.objects.values('user_id')
+            ).delete()
+        else:
+            users = affected_users(
+                followers, list(changes.values_list('user_id', flat=True))
+            )
+        rows = rebuild(users, following, followers)
+        changes.delete()
+        self.stdout.write(
+            f'Пользователей: {len(users)}, рекомендаций: {rows}, '
+            f'подписок в графе: {len(following.targets)}, '
+            f'{time.perf_counter() - start:.1f} с'
+        )
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Comment, Post
+from posts.rendering import RENDERER_VERSION, render_comment, render_post
+
+
+class Command(BaseCommand):
+    help = (
+        'Перерисовывает сохранённый HTML постов и комментариев, '
+        'созданный прошлой версией рендерера'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def rerender(self, model, render, batch_size):
+        stale = model.objects.filter(
+            html_version__lt=RENDERER_VERSION
+        ).order_by('pk').only('pk', 'text')
+        last_pk = 0
+        total = 0
+        while True:
+            batch = list(stale.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            fields = ()
+            for instance in batch:
+                rendered = render(instance.text)
+                fields = tuple(rendered)
+                for field, value in rendered.items():
+                    setattr(instance, field, value)
+            model.objects.bulk_update(batch, fields)
+            last_pk = batch[-1].pk
+            total += len(batch)
+            self.stdout.write(f'{model._meta.verbose_name_plural}: {total}')
+
+        return total
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        self.rerender(Post, render_post, batch_size)
+        self.rerender(Comment, render_comment, batch_size)
@@ -0,0 +1,126 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Count, Max
+from django.urls import reverse
+from sorl.thumbnail import get_thumbnail
+
+from posts.constants import THUMBNAIL_GEOMETRY, THUMBNAIL_OPTIONS
+from posts.models import Group, Post, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогревает кэши после деплоя или сброса кэша: создаёт миниатюры '
+        'и рендерит самые посещаемые страницы'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', required=True,
+            help='Адрес запущенного сервера с тем хостом, по которому '
+                 'приходят посетители: ключи cache_page включают хост, '
+                 'а кэш процессов сервера прогревается только их запросами',
+        )
+        parser.add_argument(
+            '--pages', type=int, default=3,
+            help='Сколько первых страниц главной прогревать',
+        )
+        parser.add_argument(
+            '--limit', type=int, default=20,
+            help='Сколько групп, профилей и постов прогревать',
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=4,
+            help='Сколько страниц и миниатюр готовить одновременно',
+        )
+
+    def hot_urls(self, pages, limit):
+        """Страницы, которые первыми откроют посетители."""
+        urls = [reverse('posts:index')] + [
+            f'{reverse("posts:index")}?page={page}'
+            for page in range(2, pages + 1)
+        ]
+        groups = Group.objects.annotate(
+            latest=Max('posts__pub_date')
+        ).filter(latest__isnull=False).order_by('-latest')[:limit]
+        urls += [
+            reverse('posts:group_list', args=(slug,))
+            for slug in groups.values_list('slug', flat=True)
+        ]
+        authors = User.objects.annotate(
+            latest=Max('posts__pub_date')
+        ).filter(latest__isnull=False).order_by('-latest')[:limit]
+        urls += [
+            reverse('posts:profile', args=(username,))
+            for username in authors.values_list('username', flat=True)
+        ]
+        # Самые обсуждаемые и самые свежие посты
+        posts = Post.objects.defer('text').annotate(
+            comment_count=Count('comments')
+        )
+        post_ids = list(dict.fromkeys([
+            *posts.order_by('-comment_count', '-pub_date').values_list(
+                'pk', flat=True
+            )[:limit],
+            *posts.values_list('pk', flat=True)[:limit],
+        ]))
+        urls += [
+            reverse('posts:post_detail', args=(pk,)) for pk in post_ids
+        ]
+
+        return urls, post_ids
+
+    def thumbnail_images(self, pages, limit, post_ids):
+        """Картинки постов с прогреваемых страниц."""
+        recent = Post.objects.exclude(image='').values_list(
+            'image', flat=True
+        )[:pages * limit]
+        hot = Post.objects.filter(pk__in=post_ids).exclude(
+            image=''
+        ).values_list('image', flat=True)
+
+        return list(dict.fromkeys([*recent, *hot]))
+
+    def make_thumbnail(self, name):
+        try:
+            field = Post._meta.get_field('image')
+            get_thumbnail(
+                field.attr_class(None, field, name),
+                THUMBNAIL_GEOMETRY, **THUMBNAIL_OPTIONS
+            )
+        finally:
+            connections.close_all()
+
+    def fetch(self, path, base_url):
+        start = time.perf_counter()
+        try:
+            status = requests.get(base_url + path, timeout=60).status_code
+        except requests.RequestException as error:
+            status = repr(error)
+
+        return path, status, time.perf_counter() - start
+
+    def handle(self, *args, **options):
+        pages, limit = options['pages'], options['limit']
+        base_url = options['url'].rstrip('/')
+        urls, post_ids = self.hot_urls(pages, limit)
+        images = self.thumbnail_images(pages, limit, post_ids)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            # Миниатюры раньше страниц: тогда рендер их уже не ждёт
+            list(pool.map(self.make_thumbnail, images))
+            self.stdout.write(f'Миниатюр: {len(images)}')
+            for path, status, duration in pool.map(
+                lambda path: self.fetch(path, base_url), urls
+            ):
+                self.stdout.write(
+                    f'{status} {path} {duration * 1000:.0f} мс'
+                )
+        self.stdout.write(
+            f'Прогрето страниц: {len(urls)} '
+            f'за {time.perf_counter() - start:.1f} с'
+        )
@@ -0,0 +1,44 @@
+# Generated by Django 2.2.16 on 2026-10-19 09:04
+
+from django.db import migrations, models
+
+from posts.rendering import make_excerpt, render_text
+
+
+def fill_excerpts(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    posts = []
+    for post in Post.objects.only('text').iterator():
+        post.excerpt, post.excerpt_truncated = make_excerpt(post.text)
+        post.excerpt_html = render_text(post.excerpt)
+        posts.append(post)
+    Post.objects.bulk_update(
+        posts, ('excerpt', 'excerpt_html', 'excerpt_truncated'),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_group_title_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='excerpt',
+            field=models.TextField(blank=True, editable=False, verbose_name='Отрывок'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='excerpt_html',
+            field=models.TextField(blank=True, editable=False, verbose_name='HTML отрывка'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='excerpt_truncated',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Текст длиннее отрывка'),
+        ),
+        migrations.RunPython(fill_excerpts, migrations.RunPython.noop),
+    ]
@@ -1,14 +1,28 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.utils import timezone
 
 from .constants import NUMBER_OF_SYMBOLS
+from .rendering import render_comment, render_post
+from .storage import ContentAddressedStorage
 
 User = get_user_model()
 
 
+def save_rendered(instance, render, save_kwargs):
+    """Обновляет поля, вычисляемые из текста, перед сохранением."""
+    update_fields = save_kwargs.get('update_fields')
+    if update_fields is None or 'text' in update_fields:
+        rendered = render(instance.text)
+        for field, value in rendered.items():
+            setattr(instance, field, value)
+        if update_fields is not None:
+            save_kwargs['update_fields'] = {*update_fields, *rendered}
+
+
 class Group(models.Model):
     """Модель групп"""
-    title = models.CharField('Заголовок', max_length=200)
+    title = models.CharField('Заголовок', max_length=200, db_index=True)
     slug = models.SlugField('Слаг', unique=True)
     description = models.TextField('Описание')
 
@@ -19,6 +33,19 @@ class Group(models.Model):
 class Post(models.Model):
     """Модель постов"""
     text = models.TextField('Текст')
+    # HTML текста и отрывок для ленты считаются при сохранении, чтобы
+    # страницы не форматировали (а лента и не загружала) полный текст
+    text_html = models.TextField('HTML текста', blank=True, editable=False)
+    html_version = models.PositiveSmallIntegerField(
+        'Версия HTML', default=0, editable=False
+    )
+    excerpt = models.TextField('Отрывок', blank=True, editable=False)
+    excerpt_html = models.TextField(
+        'HTML отрывка', blank=True, editable=False
+    )
+    excerpt_truncated = models.BooleanField(
+        'Текст длиннее отрывка', default=False, editable=False
+    )
     pub_date = models.DateTimeField('Дата публикации', auto_now_add=True)
     author = models.ForeignKey(
         User,
@@ -37,17 +64,50 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    # Размеры записываются при загрузке, чтобы не открывать файл ради них
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки', null=True, blank=True, editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки', null=True, blank=True, editable=False
+    )
+    # Логарифм суммы затухающих вкладов публикации и комментариев,
+    # см. posts.popular
+    popularity = models.FloatField(
+        'Популярность', default=0, editable=False
+    )
 
     class Meta:
-        ordering = ('-pub_date',)
+        # pk различает посты с одинаковым временем: порядок однозначен
+        # и для страниц, и для курсоров бесконечной прокрутки
+        ordering = ('-pub_date', '-pk')
+        indexes = [
+            models.Index(fields=['-popularity'], name='post_popularity'),
+            models.Index(
+                fields=['group', '-popularity'], name='post_group_popularity'
+            ),
+        ]
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
 
     def __str__(self):
         return self.text[:NUMBER_OF_SYMBOLS]
 
+    def save(self, *args, **kwargs):
+        save_rendered(self, render_post, kwargs)
+        super().save(*args, **kwargs)
+
+    def _do_update(self, base_qs, using, pk_val, values, *args):
+        # Популярность меняется только UPDATE из posts.popular: сохранение
+        # загруженного раньше поста не затрёт её, а INSERT удалённого
+        # поста по-прежнему пишет все поля
+        values = [value for value in values if value[0].name != 'popularity']
+
+        return super()._do_update(base_qs, using, pk_val, values, *args)
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -63,8 +123,16 @@ class Comment(models.Model):
     text = models.TextField(
         verbose_name='Текст комментария'
     )
+    text_html = models.TextField('HTML текста', blank=True, editable=False)
+    html_version = models.PositiveSmallIntegerField(
+        'Версия HTML', default=0, editable=False
+    )
     created = models.DateTimeField(auto_now_add=True)
 
+    def save(self, *args, **kwargs):
+        save_rendered(self, render_comment, kwargs)
+        super().save(*args, **kwargs)
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -85,3 +153,43 @@ class Follow(models.Model):
                 fields=['user', 'author'],
             )
         ]
+        # Списки подписчиков и подписок листаются по id внутри одного
+        # пользователя, без сортировки всех его подписок
+        indexes = [
+            models.Index(fields=['author', 'id'], name='follow_author_id'),
+            models.Index(fields=['user', 'id'], name='follow_user_id'),
+        ]
+
+
+class Recommendation(models.Model):
+    """Автор, на которого пользователю стоит подписаться"""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='recommendations',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    score = models.FloatField('Оценка')
+
+    class Meta:
+        ordering = ('-score', 'author_id')
+        indexes = [
+            models.Index(
+                fields=['user', '-score'], name='recommendation_user_score'
+            ),
+        ]
+
+
+class FollowChange(models.Model):
+    """Пользователь, чьи подписки изменились после расчёта рекомендаций"""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+',
+    )
+    changed = models.DateTimeField('Изменено', default=timezone.now)
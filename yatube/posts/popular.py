@@ -0,0 +1,196 @@
+"""Популярные посты: оценка затухает со временем и копится по событиям.
+
+Вклад события веса w в момент t сейчас равен w * 2 ** (-(now - t) / T),
+где T — POPULAR_HALF_LIFE. Множитель 2 ** (-now / T) общий для всех
+постов и на порядок не влияет, поэтому в Post.popularity хранится
+ln(sum(w * e ** (λt))), λ = ln 2 / T. Новое событие прибавляется одной
+операцией log_add, а старые оценки не нужно пересчитывать, пока идёт
+время. Логарифм нужен, чтобы e ** (λt) не переполнял float.
+
+Лучшие POPULAR_SIZE постов, общий список и списки групп, хранятся
+в кэше отсортированными; события вставляют пост в список сами, и
+страницы читают его без сортировки в базе.
+"""
+import logging
+import math
+from bisect import insort
+from functools import partial
+
+from django.core.cache import cache
+from django.core.paginator import Page, Paginator
+from django.db import OperationalError, transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Exp, Greatest, Least, Ln
+from django.utils import timezone
+
+from .constants import (POPULAR_CACHE_TIMEOUT, POPULAR_COMMENT_WEIGHT,
+                        POPULAR_HALF_LIFE, POPULAR_POST_WEIGHT, POPULAR_SIZE)
+from .feed import FeedItem, feed_items
+from .models import Post
+from .utils import paginator_get_page
+
+logger = logging.getLogger(__name__)
+
+DECAY = math.log(2) / POPULAR_HALF_LIFE
+# На сколько секунд правка списка блокирует его для других
+RANKING_LOCK_TIMEOUT = 5
+
+
+def event_score(weight, when):
+    """Логарифм вклада события веса weight в момент when."""
+    return math.log(weight) + DECAY * when.timestamp()
+
+
+def log_add(first, second):
+    """ln(e ** first + e ** second) без переполнения."""
+    high, low = max(first, second), min(first, second)
+
+    return high + math.log1p(math.exp(low - high))
+
+
+def ranking_key(group_id):
+    return f'popular:{group_id or "all"}'
+
+
+def ranking(group_id=None):
+    """Лучшие посты (всего сайта или группы): пары (-оценка, pk)."""
+    key = ranking_key(group_id)
+    entries = cache.get(key)
+    if entries is None:
+        posts = Post.objects.all()
+        if group_id is not None:
+            posts = posts.filter(group_id=group_id)
+        entries = [
+            (-score, pk) for pk, score in posts.order_by(
+                '-popularity', 'pk'
+            ).values_list('pk', 'popularity')[:POPULAR_SIZE]
+        ]
+        cache.set(key, entries, POPULAR_CACHE_TIMEOUT)
+
+    return entries
+
+
+def place(pk, group_id, score):
+    """Ставит пост с новой оценкой в закэшированные списки.
+
+    Оценки только растут, поэтому пост вне списка попадает в него лишь
+    при своём событии, и список остаётся верхушкой рейтинга. Списки,
+    которых нет в кэше, соберутся из базы при чтении.
+    """
+    for key in {ranking_key(None), ranking_key(group_id)}:
+        update_ranking(key, pk, score)
+
+
+def update_ranking(key, pk, score):
+    """Правит список key под блокировкой на cache.add.
+
+    Если список правит другой обработчик, правка не ждёт его, а
+    помечает список грязным и удаляет: держатель блокировки, увидев
+    пометку, тоже удалит свою запись, и список соберётся из базы,
+    где обе оценки уже сохранены.
+    """
+    lock, dirty = f'{key}:lock', f'{key}:dirty'
+    if not cache.add(lock, 1, RANKING_LOCK_TIMEOUT):
+        cache.set(dirty, 1, RANKING_LOCK_TIMEOUT)
+        cache.delete(key)
+        return
+    try:
+        entries = cache.get(key)
+        if entries is None:
+            return
+        entries = [entry for entry in entries if entry[1] != pk]
+        entry = (-score, pk)
+        if len(entries) < POPULAR_SIZE or entry < entries[-1]:
+            insort(entries, entry)
+            del entries[POPULAR_SIZE:]
+        cache.set(key, entries, POPULAR_CACHE_TIMEOUT)
+        if cache.get(dirty) is not None:
+            cache.delete_many([key, dirty])
+    finally:
+        cache.delete(lock)
+
+
+def forget(*group_ids):
+    """Сбрасывает списки: после удаления или правки поста их соберёт база."""
+    cache.delete_many(
+        {ranking_key(None)} | {ranking_key(pk) for pk in group_ids}
+    )
+
+
+def log_add_expression(field, value):
+    """log_add(field, value) для UPDATE; пустая (нулевая) оценка — value."""
+    high = Greatest(F(field), Value(value))
+    low = Least(F(field), Value(value))
+
+    return Case(
+        When(**{field: 0}, then=Value(value)),
+        default=high + Ln(1 + Exp(low - high)),
+        output_field=FloatField(),
+    )
+
+
+def bump(pk, weight, when=None):
+    """Добавляет посту событие веса weight и обновляет списки.
+
+    Оценка меняется одним UPDATE, поэтому одновременные события не
+    теряются и на SQLite, где select_for_update ничего не блокирует.
+    Событие приходит из сигнала после сохранения комментария или поста:
+    если база занята, оно пропускается (его вернёт rebuild_popularity),
+    а запрос пользователя не падает.
+    """
+    contribution = event_score(weight, when or timezone.now())
+    try:
+        with transaction.atomic():
+            if not Post.objects.filter(pk=pk).update(
+                popularity=log_add_expression('popularity', contribution)
+            ):
+                return
+            score, group_id = Post.objects.filter(pk=pk).values_list(
+                'popularity', 'group_id'
+            ).get()
+    except OperationalError:
+        logger.warning('Популярность поста %s не обновлена', pk,
+                       exc_info=True)
+        return
+    place(pk, group_id, score)
+
+
+def post_published(post):
+    bump(post.pk, POPULAR_POST_WEIGHT, post.pub_date)
+
+
+def comment_added(comment):
+    bump(comment.post_id, POPULAR_COMMENT_WEIGHT, comment.created)
+
+
+class PopularPaginator(Paginator):
+    """Страницы списка pk из кэша; посты загружаются только для страницы.
+
+    posts ограничивает выборку (например, постами группы) и отсеивает
+    посты, удалённые или перенесённые после попадания в список.
+    """
+
+    def __init__(self, pks, per_page, posts, **kwargs):
+        super().__init__(pks, per_page, **kwargs)
+        self.posts = posts
+
+    def _get_page(self, object_list, number, paginator):
+        items = {
+            item.pk: item for item in feed_items(self.posts.filter(
+                pk__in=object_list
+            ).order_by().values_list(*FeedItem.FIELDS))
+        }
+
+        page = [items[pk] for pk in object_list if pk in items]
+
+        return Page(page, number, paginator)
+
+
+def popular_page(request, group=None):
+    """Страница популярных постов группы или всего сайта."""
+    posts = Post.objects.all() if group is None else group.posts.all()
+    pks = [pk for _, pk in ranking(group and group.pk)]
+
+    return paginator_get_page(
+        pks, request, partial(PopularPaginator, posts=posts)
+    )
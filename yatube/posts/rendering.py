@@ -0,0 +1,41 @@
+from django.template.defaultfilters import linebreaksbr
+from django.utils.text import Truncator
+
+from .constants import EXCERPT_LENGTH
+
+# Увеличивается при любом изменении вывода render_text: записи со старой
+# версией перерисовывает manage.py rerender_html
+RENDERER_VERSION = 1
+
+
+def render_text(text):
+    """HTML текста поста или комментария: экранирование и переносы строк."""
+    return linebreaksbr(text, autoescape=True)
+
+
+def make_excerpt(text):
+    """Начало текста для ленты и признак того, что текст обрезан."""
+    excerpt = Truncator(text).chars(EXCERPT_LENGTH)
+
+    return excerpt, excerpt != text
+
+
+def render_post(text):
+    """Значения полей поста, которые вычисляются из его текста."""
+    excerpt, excerpt_truncated = make_excerpt(text)
+
+    return {
+        'text_html': render_text(text),
+        'excerpt': excerpt,
+        'excerpt_html': render_text(excerpt),
+        'excerpt_truncated': excerpt_truncated,
+        'html_version': RENDERER_VERSION,
+    }
+
+
+def render_comment(text):
+    """Значения полей комментария, которые вычисляются из его текста."""
+    return {
+        'text_html': render_text(text),
+        'html_version': RENDERER_VERSION,
+    }
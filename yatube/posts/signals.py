@@ -0,0 +1,140 @@
+import os
+import time
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from sorl.thumbnail import delete as delete_thumbnails
+from sorl.thumbnail.images import ImageFile
+
+from core import metrics
+
+from .constants import IMAGE_RELEASE_MIN_AGE
+from .follows import invalidate_followed
+from .fragments import forget_pending, invalidate_feeds, warm_pending
+from .groups import invalidate_groups
+from .models import Comment, Follow, Group, Post
+from .popular import comment_added, forget, post_published
+from .recommendations import mark_changed
+
+
+def release_image(name, min_age=IMAGE_RELEASE_MIN_AGE):
+    """Удаляет картинку и её миниатюры, если на неё не ссылается ни один пост.
+
+    Картинки хранятся по хэшу содержимого, поэтому один файл может
+    принадлежать нескольким постам. Файл, сохранённый меньше min_age
+    секунд назад, мог достаться посту, который ещё не записан в базу.
+    """
+    if Post.objects.filter(image=name).exists():
+        return
+    storage = Post._meta.get_field('image').storage
+    try:
+        if time.time() - os.path.getmtime(storage.path(name)) < min_age:
+            return
+        delete_thumbnails(ImageFile(name, storage))
+    except FileNotFoundError:
+        pass
+    except SuspiciousFileOperation:
+        # Имя вне MEDIA_ROOT: файл не наш, удалять нечего
+        pass
+
+
+@receiver(pre_save, sender=Post)
+def remember_old_row(sender, instance, update_fields=None, **kwargs):
+    """Запоминает прежние картинку и группу изменяемого поста."""
+    instance._old_image = instance._old_group_id = None
+    if not instance.pk:
+        return
+    old = Post.objects.filter(pk=instance.pk).values_list(
+        'image', 'group_id'
+    ).first()
+    if old is None:
+        return
+    old_image, instance._old_group_id = old
+    if update_fields is None or 'image' in update_fields:
+        if old_image != instance.image.name:
+            instance._old_image = old_image
+
+
+@receiver(post_save, sender=Post)
+def release_replaced_image(sender, instance, **kwargs):
+    old_image = getattr(instance, '_old_image', None)
+    if old_image:
+        transaction.on_commit(lambda: release_image(old_image))
+
+
+@receiver(post_delete, sender=Post)
+def release_deleted_image(sender, instance, **kwargs):
+    image = instance.image.name
+    if image:
+        transaction.on_commit(lambda: release_image(image))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, **kwargs):
+    invalidate_groups()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Follow)
+def count_created(sender, created, **kwargs):
+    if created:
+        metrics.inc(
+            'yatube_objects_created_total', model=sender._meta.model_name
+        )
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def feeds_changed(sender, **kwargs):
+    invalidate_feeds()
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follows_changed(sender, instance, **kwargs):
+    invalidate_followed(instance.user_id)
+    mark_changed(instance.user_id)
+
+
+@receiver(post_save, sender=Post)
+def post_popularity(sender, instance, created, **kwargs):
+    if created:
+        post_published(instance)
+    else:
+        # Пост мог сменить группу: списки соберутся из базы заново
+        forget(instance.group_id, getattr(instance, '_old_group_id', None))
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted_popularity(sender, instance, **kwargs):
+    forget(instance.group_id)
+
+
+@receiver(post_save, sender=Comment)
+def comment_popularity(sender, instance, created, **kwargs):
+    if created:
+        comment_added(instance)
+
+
+@receiver(request_started)
+def fragments_request_started(sender, **kwargs):
+    forget_pending()
+
+
+@receiver(request_finished)
+def fragments_request_finished(sender, **kwargs):
+    warm_pending()
+
+
+# Django подключает close_old_connections раньше приложений; прогрев
+# должен идти до него, иначе открытое прогревом соединение с базой
+# останется висеть до следующего запроса
+request_finished.disconnect(close_old_connections)
+request_finished.connect(close_old_connections)
@@ -0,0 +1,74 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+SHARD_DEPTH = 2
+SHARD_WIDTH = 2
+
+
+def is_hashed_name(name):
+    """Имя дано ContentAddressedStorage: по нему всегда одно содержимое."""
+    *directories, filename = name.split('/')
+    digest = posixpath.splitext(filename)[0]
+    shards = directories[-SHARD_DEPTH:]
+    if len(digest) != 64 or len(shards) != SHARD_DEPTH:
+        return False
+    try:
+        int(digest, 16)
+    except ValueError:
+        return False
+
+    return ''.join(shards) == digest[:SHARD_DEPTH * SHARD_WIDTH]
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище с именами по хэшу содержимого.
+
+    Файл сохраняется как ``<каталог>/ab/cd/abcd…ef.jpg``: вложенные
+    каталоги не дают одному каталогу разрастаться, а одинаковые файлы
+    хранятся один раз. Удалять файл можно только когда на него больше
+    нет ссылок (см. posts.signals).
+    """
+    def content_hash(self, content):
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+
+        return digest.hexdigest()
+
+    def hashed_name(self, name, content):
+        digest = self.content_hash(content)
+        shards = [
+            digest[index * SHARD_WIDTH:(index + 1) * SHARD_WIDTH]
+            for index in range(SHARD_DEPTH)
+        ]
+        extension = posixpath.splitext(name)[1].lower()
+
+        return posixpath.join(
+            posixpath.dirname(name), *shards, digest + extension
+        )
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        try:
+            # Свежее время изменения: release_image не удалит файл,
+            # пока ссылка на него ещё не сохранена
+            os.utime(self.path(name))
+            return name
+        except FileNotFoundError:
+            pass
+
+        return super().save(name, content, max_length)
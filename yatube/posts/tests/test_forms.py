@@ -1,11 +1,18 @@
+import hashlib
 import shutil
 import tempfile
+from io import BytesIO
+from unittest import mock
 
 from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
 
+from ..forms import GroupAutocompleteWidget, PostForm
 from ..models import Post, Group, User, Comment
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -56,6 +63,7 @@ class PostFormsTests(TestCase):
             name='small1.gif',
             content=small_gif,
             content_type='image/gif')
+        digest = hashlib.sha256(small_gif).hexdigest()
         post_count = Post.objects.count()
         form_data = {
             'text': 'Тестовый текст',
@@ -76,7 +84,7 @@ class PostFormsTests(TestCase):
                 group=PostFormsTests.group.id,
                 text='Тестовый текст',
                 author=PostFormsTests.user,
-                image='posts/small1.gif'
+                image=f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif'
             ).exists()
         )
 
@@ -121,6 +129,108 @@ class PostFormsTests(TestCase):
             ).exists()
         )
 
+    @override_settings(POST_IMAGE_MAX_SIZE=100)
+    def test_create_post_normalizes_image(self):
+        """Картинка уменьшается, поворачивается по EXIF и теряет EXIF"""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        buffer = BytesIO()
+        Image.new('RGB', (300, 200), 'red').save(
+            buffer, 'JPEG', exif=exif.tobytes()
+        )
+        uploaded = SimpleUploadedFile(
+            name='photo.jpg',
+            content=buffer.getvalue(),
+            content_type='image/jpeg')
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Фото', 'image': uploaded}
+        )
+        post = Post.objects.get(text='Фото')
+        self.assertEqual((post.image_width, post.image_height), (67, 100))
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (67, 100))
+            self.assertNotIn('exif', image.info)
+
+    def test_create_post_strips_png_exif(self):
+        """EXIF удаляется и из PNG"""
+        exif = Image.Exif()
+        exif[0x010F] = 'SecretCam GPS'
+        buffer = BytesIO()
+        Image.new('RGB', (30, 20), 'red').save(
+            buffer, 'PNG', exif=exif.tobytes()
+        )
+        uploaded = SimpleUploadedFile(
+            name='photo.png',
+            content=buffer.getvalue(),
+            content_type='image/png')
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'PNG', 'image': uploaded}
+        )
+        post = Post.objects.get(text='PNG')
+        with open(post.image.path, 'rb') as image_file:
+            self.assertNotIn(b'SecretCam', image_file.read())
+        with Image.open(post.image.path) as image:
+            self.assertNotIn('exif', image.info)
+
+    def test_group_choices_cached(self):
+        """Список групп формы берётся из кэша и сбрасывается при изменении"""
+        PostForm()
+        with self.assertNumQueries(0):
+            html = str(PostForm()['group'])
+        self.assertIn(PostFormsTests.group.title, html)
+        Group.objects.create(title='Новая группа', slug='new-group')
+        self.assertIn('Новая группа', str(PostForm()['group']))
+
+    def test_group_autocomplete(self):
+        """Автодополнение ищет группы по началу названия и слага"""
+        response = self.client.get(
+            reverse('posts:group_autocomplete'), {'q': 'slug-test1'}
+        )
+        self.assertEqual(response.json()['results'], [
+            {'slug': 'slug-test1', 'title': 'Тестовая группа1'}
+        ])
+
+    def test_group_autocomplete_by_title_prefix(self):
+        """Название ищется диапазоном по индексу, в том числе со строчной"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('posts:group_autocomplete'), {'q': 'тестовая группа1'}
+            )
+        self.assertEqual(response.json()['results'], [
+            {'slug': 'slug-test1', 'title': 'Тестовая группа1'}
+        ])
+        self.assertFalse([
+            query['sql'] for query in queries.captured_queries
+            if 'LIKE' in query['sql']
+        ])
+
+    def test_many_groups_use_autocomplete(self):
+        """При множестве групп поле выбирает группу по слагу"""
+        with mock.patch('posts.forms.GROUP_SELECT_LIMIT', 1):
+            form = PostForm(data={'text': 'Текст', 'group': 'slug-test1'})
+        self.assertIsInstance(
+            form.fields['group'].widget, GroupAutocompleteWidget
+        )
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['group'], PostFormsTests.group1)
+
+    def test_autocomplete_edit_shows_slug(self):
+        """Форма редактирования с автодополнением подставляет слаг группы"""
+        post = Post.objects.create(
+            author=PostFormsTests.user, text='Текст',
+            group=PostFormsTests.group1,
+        )
+        with mock.patch('posts.forms.GROUP_SELECT_LIMIT', 1):
+            form = PostForm(instance=post)
+            self.assertIn('value="slug-test1"', str(form['group']))
+            form = PostForm(
+                data={'text': 'Текст', 'group': form['group'].value()},
+                instance=post,
+            )
+            self.assertTrue(form.is_valid())
+
     def test_create_comment(self):
         """Валидная форма добавляет комментарий"""
         comments_count = Comment.objects.count()
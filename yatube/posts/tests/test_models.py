@@ -1,6 +1,10 @@
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
 
-from ..models import Group, Post, User
+from ..models import Comment, Group, Post, User
+from ..rendering import RENDERER_VERSION
 from ..constants import NUMBER_OF_SYMBOLS
 
 
@@ -58,3 +62,26 @@ class PostModelTest(TestCase):
             with self.subTest(field=field):
                 self.assertEqual(
                     post._meta.get_field(field).help_text, expected_value)
+
+    def test_rendered_html_saved(self):
+        """HTML текста сохраняется вместе с постом и комментарием"""
+        post = PostModelTest.post
+        post.text = '<b>жирный</b>\nтекст'
+        post.save(update_fields=('text',))
+        comment = Comment.objects.create(
+            post=post, author=PostModelTest.user, text='a\nb'
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.text_html, '&lt;b&gt;жирный&lt;/b&gt;<br>текст')
+        self.assertEqual(post.html_version, RENDERER_VERSION)
+        self.assertEqual(comment.text_html, 'a<br>b')
+
+    def test_rerender_stale_html(self):
+        """rerender_html перерисовывает записи старой версии"""
+        Post.objects.filter(pk=PostModelTest.post.pk).update(
+            text_html='', html_version=0
+        )
+        call_command('rerender_html', stdout=StringIO())
+        post = Post.objects.get(pk=PostModelTest.post.pk)
+        self.assertEqual(post.html_version, RENDERER_VERSION)
+        self.assertEqual(post.text_html, post.text)
@@ -0,0 +1,165 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from sorl.thumbnail import default, delete, get_thumbnail
+
+from ..constants import THUMBNAIL_GEOMETRY, THUMBNAIL_OPTIONS
+from ..models import Post, User
+from ..signals import release_image
+from ..thumbnails import prefetch_thumbnails, thumbnail_key
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, name):
+        return Post.objects.create(
+            author=ContentAddressedStorageTest.user,
+            text='Тестовый пост',
+            image=SimpleUploadedFile(name, SMALL_GIF, 'image/gif'),
+        )
+
+    def test_same_content_stored_once(self):
+        """Одинаковые картинки хранятся одним файлом в шардах"""
+        first = self.create_post('first.gif')
+        second = self.create_post('second.GIF')
+        self.assertEqual(first.image.name, second.image.name)
+        directory, filename = os.path.split(first.image.name)
+        self.assertEqual(directory, f'posts/{filename[:2]}/{filename[2:4]}')
+        self.assertEqual(len(os.listdir(os.path.dirname(first.image.path))), 1)
+
+    def test_release_keeps_referenced_image(self):
+        """Файл удаляется только когда на него не ссылается ни один пост"""
+        first = self.create_post('first.gif')
+        second = self.create_post('second.gif')
+        path = first.image.path
+        first.delete()
+        release_image(first.image.name, min_age=0)
+        self.assertTrue(os.path.exists(path))
+        second.delete()
+        release_image(second.image.name)
+        self.assertTrue(os.path.exists(path))
+        release_image(second.image.name, min_age=0)
+        self.assertFalse(os.path.exists(path))
+
+    def test_reused_file_is_touched(self):
+        """Повторная загрузка обновляет время файла и защищает его"""
+        first = self.create_post('first.gif')
+        os.utime(first.image.path, (0, 0))
+        self.create_post('second.gif')
+        self.assertGreater(os.path.getmtime(first.image.path), 0)
+        Post.objects.all().delete()
+        release_image(first.image.name)
+        self.assertTrue(os.path.exists(first.image.path))
+
+    def test_gc_media_removes_orphans(self):
+        """gc_media удаляет только файлы без ссылок"""
+        post = self.create_post('first.gif')
+        orphans = [
+            os.path.join(TEMP_MEDIA_ROOT, 'posts', 'zz', 'orphan.gif'),
+            os.path.join(TEMP_MEDIA_ROOT, 'cache', 'ab', 'thumb.jpg'),
+        ]
+        for path in orphans:
+            os.makedirs(os.path.dirname(path))
+            with open(path, 'wb') as file:
+                file.write(SMALL_GIF)
+        call_command('gc_media', '--dry-run', '--min-age=0', stdout=StringIO())
+        self.assertTrue(all(os.path.exists(path) for path in orphans))
+        out = StringIO()
+        call_command('gc_media', '--min-age=0', stdout=out)
+        self.assertFalse(any(os.path.exists(path) for path in orphans))
+        self.assertTrue(os.path.exists(post.image.path))
+        self.assertIn(
+            f'Освобождено: {2 * len(SMALL_GIF)} байт', out.getvalue()
+        )
+
+    def test_gc_media_checks_order_before_deleting(self):
+        """При небайтовой сортировке в базе gc_media ничего не удаляет"""
+        orphan = os.path.join(TEMP_MEDIA_ROOT, 'posts', 'orphan.gif')
+        os.makedirs(os.path.dirname(orphan), exist_ok=True)
+        with open(orphan, 'wb') as file:
+            file.write(SMALL_GIF)
+        self.addCleanup(os.remove, orphan)
+        with mock.patch(
+            'posts.management.commands.gc_media.referenced_images',
+            return_value=iter(['posts/b.gif', 'posts/a.gif']),
+        ):
+            with self.assertRaises(CommandError):
+                call_command('gc_media', '--min-age=0', stdout=StringIO())
+        self.assertTrue(os.path.exists(orphan))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailLRUTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Тестовый пост',
+            image=SimpleUploadedFile('lru.gif', SMALL_GIF, 'image/gif'),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_prefetched_thumbnail_served_from_lru(self):
+        """После предзагрузки миниатюра находится без обращения к кэшу"""
+        post = ThumbnailLRUTest.post
+        thumbnail = get_thumbnail(
+            post.image, THUMBNAIL_GEOMETRY, **THUMBNAIL_OPTIONS
+        )
+        kvstore = default.kvstore
+        key = thumbnail_key(
+            post.image, THUMBNAIL_GEOMETRY, **THUMBNAIL_OPTIONS
+        )
+        kvstore.lru.clear()
+        prefetch_thumbnails([post])
+        self.assertIsNotNone(kvstore.lookup(key)[0])
+        hits = kvstore.stats()['hits']
+        with self.assertNumQueries(0):
+            cached = get_thumbnail(
+                post.image, THUMBNAIL_GEOMETRY, **THUMBNAIL_OPTIONS
+            )
+        self.assertEqual(cached.name, thumbnail.name)
+        self.assertEqual(kvstore.stats()['hits'], hits + 1)
+
+    def test_delete_invalidates_lru(self):
+        """Удаление картинки убирает её миниатюры из LRU"""
+        post = ThumbnailLRUTest.post
+        get_thumbnail(post.image, THUMBNAIL_GEOMETRY, **THUMBNAIL_OPTIONS)
+        key = thumbnail_key(
+            post.image, THUMBNAIL_GEOMETRY, **THUMBNAIL_OPTIONS
+        )
+        self.assertIsNotNone(default.kvstore.lookup(key)[0])
+        delete(post.image, delete_file=False)
+        self.assertFalse(default.kvstore.lookup(key)[1])
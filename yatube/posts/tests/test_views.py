@@ -1,15 +1,37 @@
 import shutil
 import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-from django.test import TestCase, Client, override_settings
+import requests
+
+from django.core.management import call_command
+from django.test import (
+    TestCase, LiveServerTestCase, Client, override_settings
+)
 from django.urls import reverse
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
-
-from ..models import Post, Group, User, Comment, Follow
-from ..constants import NUMBER_OF_POSTS, NUMBER_OF_SYMBOLS_2ND_PAGE
+from django.db import OperationalError, connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core import metrics
+
+from ..models import (
+    Post, Group, User, Comment, Follow, FollowChange, Recommendation
+)
+from ..constants import (
+    EXCERPT_LENGTH, FOLLOWS_PER_PAGE, NUMBER_OF_POSTS,
+    NUMBER_OF_SYMBOLS_2ND_PAGE, POPULAR_COMMENT_WEIGHT
+)
 from ..forms import CommentForm, PostForm
+from ..feed import FeedItem
+from ..follows import followed_ids, is_following
+from ..popular import event_score, log_add, ranking, ranking_key
+from ..rendering import render_text
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -214,6 +236,46 @@ class PostViewsTests(TestCase):
         )
         self.assertNotIn(post, response.context["page_obj"].object_list)
 
+    def test_feed_shows_excerpt(self):
+        """В ленте длинный пост показывается отрывком"""
+        cache.clear()
+        text = 'слово\n' * EXCERPT_LENGTH
+        post = Post.objects.create(author=PostViewsTests.user, text=text)
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertIsInstance(response.context['page_obj'][0], FeedItem)
+        self.assertContains(response, post.excerpt_html)
+        self.assertNotContains(response, render_text(text))
+        self.assertContains(response, 'читать дальше')
+
+    def test_feeds_skip_rendered_text(self):
+        """Ленты группы и автора не читают полный и отрисованный текст"""
+        for url in (
+            reverse('posts:group_list', args=(PostViewsTests.group.slug,)),
+            reverse('posts:profile', args=(PostViewsTests.user.username,)),
+        ):
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertIsInstance(
+                    response.context['page_obj'][0], FeedItem
+                )
+                self.assertFalse([
+                    query['sql'] for query in queries.captured_queries
+                    if '"posts_post"."text' in query['sql']
+                ])
+
+    def test_feed_text_loaded_once_per_page(self):
+        """Полный текст постов ленты читается одним запросом на страницу"""
+        cache.clear()
+        page = self.authorized_client.get(
+            reverse('posts:index')
+        ).context['page_obj']
+        with self.assertNumQueries(1):
+            texts = [item.text for item in page]
+        self.assertEqual(texts, [
+            Post.objects.get(pk=item.pk).text for item in page
+        ])
+
     def test_index_cache(self):
         """Тест кэша главной страницы"""
         new_post = Post.objects.create(
@@ -288,6 +350,59 @@ class PostViewsTests(TestCase):
                       response_new_user.context["page_obj"].object_list)
         self.assertNotIn(new_post, response.context["page_obj"].object_list)
 
+    @override_settings(THROTTLE_RATES={'follow': {'user': '2/m'}})
+    def test_follow_throttled(self):
+        """Частые подписки отклоняются с кодом 429"""
+        cache.clear()
+        url = reverse('posts:profile_follow', kwargs={
+            'username': PostViewsTests.user1
+        })
+        for _ in range(2):
+            self.authorized_client.post(url)
+        sample = metrics.sample_name('yatube_throttled_total', scope='follow')
+        throttled = metrics.registry.values[sample]
+        with self.assertLogs('core.throttling', 'WARNING'):
+            response = self.authorized_client.post(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(metrics.registry.values[sample], throttled + 1)
+
+    @override_settings(THROTTLE_RATES={'follow': {'ip': '1/m'}},
+                       THROTTLE_TRUSTED_PROXIES=['127.0.0.1'])
+    def test_throttle_client_behind_proxy(self):
+        """За доверенным прокси лимит по IP считается по X-Forwarded-For"""
+        cache.clear()
+        url = reverse('posts:profile_follow', kwargs={
+            'username': PostViewsTests.user1
+        })
+        for client_ip in ('10.0.0.1', '10.0.0.2'):
+            response = self.authorized_client.post(
+                url, HTTP_X_FORWARDED_FOR=f'1.2.3.4, {client_ip}'
+            )
+            self.assertEqual(response.status_code, 302)
+        with self.assertLogs('core.throttling', 'WARNING'):
+            response = self.authorized_client.post(
+                url, HTTP_X_FORWARDED_FOR='10.0.0.1'
+            )
+        self.assertEqual(response.status_code, 429)
+
+    @override_settings(
+        THROTTLE_RATES={'follow': {'user': '2/m', 'ip': '1/m'}}
+    )
+    def test_blocked_ip_keeps_user_quota(self):
+        """Запрос, отклонённый по IP, не тратит лимит пользователя"""
+        cache.clear()
+        url = reverse('posts:profile_follow', kwargs={
+            'username': PostViewsTests.user1
+        })
+        self.authorized_client.post(url)
+        with self.assertLogs('core.throttling', 'WARNING'):
+            for _ in range(3):
+                self.authorized_client.post(url)
+        self.client.force_login(PostViewsTests.user)
+        response = self.client.post(url, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 302)
+
     def test_follow_to_yourself(self):
         """Пользователь не может подписаться на себя"""
         count_follow = Follow.objects.count()
@@ -371,3 +486,374 @@ class PaginatorViewsTest(TestCase):
                     len(response_page_2.context['page_obj']),
                     NUMBER_OF_SYMBOLS_2ND_PAGE
                 )
+
+
+class FragmentViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        Post.objects.bulk_create(
+            Post(author=cls.user, group=cls.group, text=f'Пост {number}')
+            for number in range(NUMBER_OF_POSTS + 5)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_page_links_next_fragment(self):
+        """Страница ссылается на порцию, продолжающую её"""
+        urls = {
+            reverse('posts:index'): reverse('posts:index_fragment'),
+            reverse('posts:group_list', args=('group',)): reverse(
+                'posts:group_list_fragment', args=('group',)
+            ),
+            reverse('posts:profile', args=('author',)): reverse(
+                'posts:profile_fragment', args=('author',)
+            ),
+        }
+        for page_url, fragment_url in urls.items():
+            with self.subTest(page_url=page_url):
+                page = self.client.get(page_url)
+                next_url = page.context['next_url']
+                self.assertTrue(next_url.startswith(fragment_url + '?cursor='))
+                fragment = self.client.get(next_url)
+                self.assertNotIn('X-Next-Cursor', fragment)
+                posts = list(Post.objects.all())
+                for post in posts[:NUMBER_OF_POSTS]:
+                    self.assertNotContains(fragment, f'/posts/{post.pk}/"')
+                for post in posts[NUMBER_OF_POSTS:]:
+                    self.assertContains(fragment, f'/posts/{post.pk}/"')
+
+    def test_next_fragment_is_warmed(self):
+        """После ответа следующая порция уже лежит в кэше"""
+        response = self.client.get(reverse('posts:index_fragment'))
+        self.assertEqual(len(response.context['posts']), NUMBER_OF_POSTS)
+        cursor = response['X-Next-Cursor']
+        with self.assertNumQueries(0):
+            self.client.get(
+                reverse('posts:index_fragment'), {'cursor': cursor}
+            )
+
+    def test_new_post_invalidates_fragments(self):
+        self.client.get(reverse('posts:index_fragment'))
+        Post.objects.create(author=self.user, text='Свежий пост')
+        response = self.client.get(reverse('posts:index_fragment'))
+        self.assertContains(response, 'Свежий пост')
+
+    def test_bad_cursor(self):
+        response = self.client.get(
+            reverse('posts:index_fragment'), {'cursor': 'abc'}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_unknown_feed_owner(self):
+        """Фрагмент несуществующего автора или группы — 404"""
+        for url in (reverse('posts:profile_fragment', args=('nobody',)),
+                    reverse('posts:group_list_fragment', args=('nobody',))):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_cached_index_does_not_load_all_posts(self):
+        """Кэширование главной не тянет за собой полные тексты постов"""
+        self.addCleanup(cache.clear)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('posts:index'))
+        self.assertFalse([
+            query['sql'] for query in queries.captured_queries
+            if '"posts_post"."text"' in query['sql']
+        ])
+
+
+class FollowGraphTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader')
+        cls.authors = [
+            User.objects.create_user(username=f'author{number}')
+            for number in range(3)
+        ]
+        for author in cls.authors:
+            Post.objects.create(author=author, text=f'Пост {author}')
+        Follow.objects.create(user=cls.reader, author=cls.authors[1])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(FollowGraphTest.reader)
+
+    def test_followed_ids_cached(self):
+        """Подписки читаются из кэша и сбрасываются при подписке"""
+        reader = FollowGraphTest.reader
+        self.assertEqual(list(followed_ids(reader)), [self.authors[1].pk])
+        reader = User.objects.get(pk=reader.pk)
+        with self.assertNumQueries(0):
+            self.assertFalse(is_following(reader, self.authors[0].pk))
+        Follow.objects.create(user=reader, author=self.authors[0])
+        reader = User.objects.get(pk=reader.pk)
+        self.assertTrue(is_following(reader, self.authors[0].pk))
+
+    def test_feed_marks_followed_authors(self):
+        """Лента отмечает авторов, на которых подписан читатель"""
+        fragment = self.client.get(reverse('posts:index_fragment'))
+        self.assertContains(fragment, 'вы подписаны', count=1)
+        response = self.client.get(reverse('posts:followed_ids'))
+        self.assertEqual(response.json(), {'ids': [self.authors[1].pk]})
+
+    def test_cached_index_has_no_personal_marks(self):
+        """Главная из cache_page одинакова для всех: отметки ставит скрипт"""
+        self.addCleanup(cache.clear)
+        self.client.get(reverse('posts:index'))
+        response = Client().get(reverse('posts:index'))
+        for author in self.authors:
+            self.assertContains(
+                response, f'data-followed-author="{author.pk}" hidden'
+            )
+        self.assertNotContains(
+            response, '<span class="badge bg-secondary">вы подписаны'
+        )
+        response = Client().get(reverse('posts:followed_ids'))
+        self.assertEqual(response.json(), {'ids': []})
+
+
+class FollowListTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='owner')
+        cls.fans = [
+            User.objects.create(username=f'fan{number}')
+            for number in range(FOLLOWS_PER_PAGE + 5)
+        ]
+        Follow.objects.bulk_create(
+            Follow(user=fan, author=cls.owner) for fan in cls.fans
+        )
+        Follow.objects.create(user=cls.owner, author=cls.fans[-1])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(FollowListTest.owner)
+
+    def test_followers_keyset_pages(self):
+        """Подписчики листаются по курсору, новые — первыми"""
+        url = reverse('posts:followers', args=('owner',))
+        response = self.client.get(url)
+        rows = response.context['rows']
+        self.assertEqual(len(rows), FOLLOWS_PER_PAGE)
+        self.assertEqual(rows[0][0].username, self.fans[-1].username)
+        response = self.client.get(
+            url, {'cursor': response.context['next_cursor']}
+        )
+        self.assertEqual(len(response.context['rows']), 5)
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_relation_badges(self):
+        """Взаимные подписки и подписчики зрителя отмечаются"""
+        response = self.client.get(
+            reverse('posts:followers', args=('owner',))
+        )
+        relations = dict(
+            (person.username, relation)
+            for person, relation in response.context['rows']
+        )
+        self.assertEqual(relations[self.fans[-1].username], 'mutual')
+        self.assertEqual(relations[self.fans[-2].username], 'follows_you')
+        self.assertContains(response, 'взаимная подписка', count=1)
+        response = self.client.get(
+            reverse('posts:following', args=('owner',))
+        )
+        self.assertEqual(
+            [(person.username, relation)
+             for person, relation in response.context['rows']],
+            [(self.fans[-1].username, 'mutual')]
+        )
+
+
+class RecommendationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = {
+            name: User.objects.create_user(username=name)
+            for name in ('reader', 'a', 'b', 'c', 'd', 'e', 'other')
+        }
+        for user, author in (('reader', 'a'), ('reader', 'b'), ('a', 'c'),
+                             ('b', 'c'), ('b', 'd'), ('other', 'a'),
+                             ('other', 'e')):
+            cls.follow(user, author)
+        call_command('recommend_follows', full=True, stdout=StringIO())
+
+    @classmethod
+    def follow(cls, user, author):
+        Follow.objects.create(user=cls.users[user], author=cls.users[author])
+
+    def recommended(self, name):
+        return list(Recommendation.objects.filter(
+            user=self.users[name]
+        ).values_list('author__username', 'score'))
+
+    def test_scores_friends_of_friends_and_cofollows(self):
+        """Друзья друзей весят больше совместных подписок"""
+        self.assertEqual(
+            self.recommended('reader'), [('c', 2), ('d', 1), ('e', 0.5)]
+        )
+        self.assertFalse(FollowChange.objects.exists())
+
+    def test_incremental_rebuild(self):
+        """Пересчёт затрагивает изменившихся и их подписчиков"""
+        self.follow('reader', 'c')
+        self.follow('a', 'e')
+        self.assertEqual(FollowChange.objects.count(), 2)
+        call_command('recommend_follows', stdout=StringIO())
+        self.assertEqual(
+            self.recommended('reader'), [('e', 2), ('d', 1.5)]
+        )
+        self.assertFalse(FollowChange.objects.exists())
+
+    def test_panel(self):
+        """Панель показывает рекомендации без уже подписанных авторов"""
+        cache.clear()
+        self.follow('reader', 'd')
+        self.client.force_login(self.users['reader'])
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            [author.username for author in response.context[
+                'recommendations'
+            ]],
+            ['c', 'e']
+        )
+        self.assertContains(response, 'Рекомендуем подписаться')
+        response = self.client.get(reverse('posts:profile', args=('a',)))
+        self.assertEqual(len(response.context['recommendations']), 2)
+
+
+class PopularTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.old = Post.objects.create(
+            author=cls.user, group=cls.group, text='Старый пост'
+        )
+        cls.new = Post.objects.create(
+            author=cls.user, group=cls.group, text='Новый пост'
+        )
+        three_days_ago = timezone.now() - timedelta(days=3)
+        Post.objects.filter(pk=cls.old.pk).update(pub_date=three_days_ago)
+        Comment.objects.create(post=cls.old, author=cls.user, text='Давно')
+        Comment.objects.filter(post=cls.old).update(created=three_days_ago)
+        call_command('rebuild_popularity', stdout=StringIO())
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.force_login(PopularTest.user)
+
+    def popular(self, url):
+        return [post.pk for post in self.client.get(url).context['page_obj']]
+
+    def test_comment_lifts_post_incrementally(self):
+        """Старые события затухают, новый комментарий поднимает пост"""
+        # Страница из кэша: запрос постов страницы (и группы)
+        urls = {
+            reverse('posts:popular'): 1,
+            reverse('posts:group_popular', args=('group',)): 2,
+        }
+        for url in urls:
+            self.assertEqual(self.popular(url), [self.new.pk, self.old.pk])
+        self.client.post(
+            reverse('posts:add_comment', args=(self.old.pk,)),
+            {'text': 'Свежий комментарий'},
+        )
+        # Списки обновлены в кэше, без пересборки из базы
+        self.assertEqual(
+            cache.get(ranking_key(None))[0][1], self.old.pk
+        )
+        for url, queries in urls.items():
+            with self.assertNumQueries(queries):
+                self.assertEqual(
+                    self.popular(url), [self.old.pk, self.new.pk]
+                )
+
+    def test_edit_keeps_score_and_forgets_old_group(self):
+        """Правка поста не затирает оценку и сбрасывает список старой группы"""
+        other = Group.objects.create(title='Другая', slug='other')
+        ranking(self.group.pk)
+        stale = Post.objects.get(pk=self.new.pk)
+        Comment.objects.create(post=self.new, author=self.user, text='Ещё')
+        bumped = Post.objects.get(pk=self.new.pk).popularity
+        stale.group = other
+        stale.save()
+        self.assertEqual(Post.objects.get(pk=self.new.pk).popularity, bumped)
+        self.assertIsNone(cache.get(ranking_key(self.group.pk)))
+        self.assertEqual(ranking(self.group.pk)[0][1], self.old.pk)
+
+    def test_bump_adds_event_in_update(self):
+        """Событие прибавляется к оценке в базе, а не к прочитанной"""
+        score = Post.objects.get(pk=self.old.pk).popularity
+        comment = Comment.objects.create(
+            post=self.old, author=self.user, text='Ещё'
+        )
+        self.assertAlmostEqual(
+            Post.objects.get(pk=self.old.pk).popularity,
+            log_add(score, event_score(
+                POPULAR_COMMENT_WEIGHT, comment.created
+            )),
+        )
+
+    def test_busy_database_does_not_fail_comment(self):
+        """Если база занята, комментарий сохраняется без оценки"""
+        score = Post.objects.get(pk=self.old.pk).popularity
+        with mock.patch(
+            'django.db.models.query.QuerySet.update',
+            side_effect=OperationalError('database is locked'),
+        ), self.assertLogs('posts.popular', 'WARNING'):
+            response = self.client.post(
+                reverse('posts:add_comment', args=(self.old.pk,)),
+                {'text': 'В занятую базу'},
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Comment.objects.filter(text='В занятую базу'))
+        self.assertEqual(Post.objects.get(pk=self.old.pk).popularity, score)
+
+    def test_save_deleted_post_inserts_it(self):
+        """Сохранение удалённого поста снова создаёт его"""
+        post = Post.objects.get(pk=self.new.pk)
+        Post.objects.filter(pk=post.pk).delete()
+        post.save()
+        self.assertTrue(Post.objects.filter(pk=post.pk).exists())
+
+    def test_contended_list_is_dropped(self):
+        """Если список правит другой обработчик, он сбрасывается"""
+        key = ranking_key(None)
+        ranking()
+        cache.add(f'{key}:lock', 1)
+        Comment.objects.create(post=self.old, author=self.user, text='Ещё')
+        self.assertIsNone(cache.get(key))
+        cache.delete(f'{key}:lock')
+        self.assertEqual(ranking()[0][1], self.old.pk)
+
+    def test_deleted_post_leaves_list(self):
+        """Удалённый пост пропадает из популярного"""
+        self.assertEqual(len(self.popular(reverse('posts:popular'))), 2)
+        Post.objects.filter(pk=self.new.pk).delete()
+        self.assertEqual(
+            self.popular(reverse('posts:popular')), [self.old.pk]
+        )
+
+
+class WarmCacheTest(LiveServerTestCase):
+    def test_warm_cache_fills_index_cache(self):
+        """warm_cache запрашивает горячие страницы у сервера и кэширует их"""
+        cache.clear()
+        self.addCleanup(cache.clear)
+        user = User.objects.create_user(username='author')
+        group = Group.objects.create(title='Группа', slug='group')
+        post = Post.objects.create(author=user, group=group, text='Пост')
+        out = StringIO()
+        call_command(
+            'warm_cache', url=self.live_server_url, concurrency=2, stdout=out
+        )
+        for url in ('/', '/group/group/', '/profile/author/',
+                    f'/posts/{post.pk}/'):
+            self.assertIn(f'200 {url} ', out.getvalue())
+        Post.objects.create(author=user, text='Пост после прогрева')
+        response = requests.get(self.live_server_url + '/')
+        self.assertNotIn('Пост после прогрева', response.text)
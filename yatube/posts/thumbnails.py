@@ -0,0 +1,155 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import defaults as thumbnail_defaults
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core import metrics
+
+from .constants import THUMBNAIL_GEOMETRY, THUMBNAIL_OPTIONS
+
+
+class LRUKVStore(KVStore):
+    """KV-хранилище sorl-thumbnail с ограниченным LRU в памяти процесса.
+
+    Стоит перед кэшем и базой cached_db-хранилища: повторные {% thumbnail %}
+    для одних и тех же картинок не ходят даже в кэш. Записи живут не дольше
+    THUMBNAIL_LRU_TTL, чтобы изменения из других процессов доходили
+    до этого.
+    """
+    def __init__(self):
+        super().__init__()
+        self.lru = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.prefetched = 0
+
+    def remember(self, key, value):
+        expires = time.monotonic() + settings.THUMBNAIL_LRU_TTL
+        with self.lock:
+            self.lru[key] = (value, expires)
+            self.lru.move_to_end(key)
+            while len(self.lru) > settings.THUMBNAIL_LRU_SIZE:
+                self.lru.popitem(last=False)
+
+    def lookup(self, key):
+        """Значение из LRU и признак попадания."""
+        with self.lock:
+            entry = self.lru.get(key)
+            if entry is None:
+                return None, False
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.lru[key]
+                return None, False
+            self.lru.move_to_end(key)
+
+        return value, True
+
+    def _get_raw(self, key):
+        value, found = self.lookup(key)
+        if found:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = super()._get_raw(key)
+        self.remember(key, value)
+
+        return value
+
+    def _set_raw(self, key, value):
+        super()._set_raw(key, value)
+        self.remember(key, value)
+
+    def _delete_raw(self, *keys):
+        super()._delete_raw(*keys)
+        with self.lock:
+            for key in keys:
+                self.lru.pop(key, None)
+
+    def clear(self, delete_thumbnails=False):
+        super().clear(delete_thumbnails)
+        with self.lock:
+            self.lru.clear()
+
+    def prefetch(self, keys):
+        """Загружает в LRU сразу несколько ключей: один get_many к кэшу
+        и один запрос к базе для промахов кэша."""
+        missing = [key for key in keys if not self.lookup(key)[1]]
+        if not missing:
+            return
+        values = self.cache.get_many(missing)
+        not_cached = [key for key in missing if key not in values]
+        if not_cached:
+            stored = dict(KVStoreModel.objects.filter(
+                key__in=not_cached
+            ).values_list('key', 'value'))
+            self.cache.set_many(
+                stored, thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT
+            )
+            values.update(stored)
+        for key in missing:
+            value = values.get(key)
+            # Пустые значения cached_db-хранилище хранит как EMPTY_VALUE
+            self.remember(key, value if isinstance(value, str) else None)
+        self.prefetched += len(missing)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'prefetched': self.prefetched,
+            'size': len(self.lru),
+        }
+
+
+def thumbnail_key(file_, geometry_string, **options):
+    """Ключ миниатюры в KV-хранилище, как его вычисляет
+    ThumbnailBackend.get_thumbnail для тех же аргументов."""
+    backend = default.backend
+    source = ImageFile(file_)
+    if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(thumbnail_settings, attr)
+        if value != getattr(thumbnail_defaults, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(source, geometry_string, options)
+
+    return add_prefix(ImageFile(name, default.storage).key)
+
+
+def prefetch_thumbnails(posts):
+    """Одним запросом подгружает миниатюры всех картинок страницы."""
+    kvstore = default.kvstore
+    if not hasattr(kvstore, 'prefetch'):
+        return
+    kvstore.prefetch([
+        thumbnail_key(post.image, THUMBNAIL_GEOMETRY, **THUMBNAIL_OPTIONS)
+        for post in posts
+        if post.image
+    ])
+
+
+@metrics.collector
+def thumbnail_metrics():
+    """Счётчики LRU миниатюр этого процесса для /metrics."""
+    kvstore = default.kvstore
+    if not hasattr(kvstore, 'stats'):
+        return {}
+    stats = kvstore.stats()
+
+    return {
+        metrics.sample_name(
+            'yatube_thumbnail_kvstore_lookups_total', result=result
+        ): stats[result]
+        for result in ('hits', 'misses', 'prefetched')
+    }
@@ -6,8 +6,42 @@ app_name = 'posts'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('fragments/', views.index_fragment, name='index_fragment'),
+    path('popular/', views.popular, name='popular'),
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
+    path(
+        'group/<slug:slug>/popular/',
+        views.group_popular,
+        name='group_popular'
+    ),
+    path(
+        'fragments/group/<slug:slug>/',
+        views.group_posts_fragment,
+        name='group_list_fragment'
+    ),
+    path(
+        'groups/autocomplete/',
+        views.group_autocomplete,
+        name='group_autocomplete'
+    ),
     path('profile/<str:username>/', views.profile, name='profile'),
+    path(
+        'profile/<str:username>/followers/',
+        views.follow_list,
+        {'kind': 'followers'},
+        name='followers'
+    ),
+    path(
+        'profile/<str:username>/following/',
+        views.follow_list,
+        {'kind': 'following'},
+        name='following'
+    ),
+    path(
+        'fragments/profile/<str:username>/',
+        views.profile_fragment,
+        name='profile_fragment'
+    ),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
@@ -17,6 +51,12 @@ urlpatterns = [
         name='add_comment'
     ),
     path('follow/', views.follow_index, name='follow_index'),
+    path('follow/ids/', views.followed_authors, name='followed_ids'),
+    path(
+        'fragments/follow/',
+        views.follow_index_fragment,
+        name='follow_index_fragment'
+    ),
     path(
         'profile/<str:username>/follow/',
         views.profile_follow,
@@ -1,11 +1,13 @@
 from django.core.paginator import Paginator
 
 from .constants import NUMBER_OF_POSTS
+from .thumbnails import prefetch_thumbnails
 
 
-def paginator_get_page(posts, request):
-    paginator = Paginator(posts, NUMBER_OF_POSTS)
+def paginator_get_page(posts, request, paginator_class=Paginator):
+    paginator = paginator_class(posts, NUMBER_OF_POSTS)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
+    prefetch_thumbnails(page_obj)
 
     return page_obj
@@ -1,57 +1,141 @@
+from django.http import Http404, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
+from django.views.decorators.cache import cache_page, never_cache
+
+from core.throttling import throttle
 
 from .models import Post, Group, User, Follow
+from .feed import FeedPaginator
+from .follows import follow_page, followed_ids, is_following, relations
+from .fragments import Fragment, page_fragment
 from .forms import PostForm, CommentForm
+from .groups import search_groups
+from .popular import popular_page
+from .recommendations import recommended_authors
 from .utils import paginator_get_page
 
 
 @cache_page(20, key_prefix='index_page')
 def index(request):
     """Главная страница"""
-    posts = Post.objects.select_related(
-        'group', 'author'
-    ).all()
-    page_obj = paginator_get_page(posts, request)
+    posts = Post.objects.all()
+    page_obj = paginator_get_page(posts, request, FeedPaginator)
+    fragment, cursor = page_fragment(
+        request, 'posts:index_fragment', (), page_obj
+    )
     context = {
         'page_obj': page_obj,
+        'next_url': fragment.next_url(cursor),
     }
+    response = render(request, 'posts/index.html', context)
+    fragment.warm_later(cursor)
+
+    return response
+
+
+def index_fragment(request):
+    """Порция главной ленты для бесконечной прокрутки"""
+    fragment = Fragment('posts:index_fragment', (), request.user)
 
-    return render(request, 'posts/index.html', context)
+    return fragment.response(request.GET.get('cursor'))
 
 
 def group_posts(request, slug):
     """Страница группы"""
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    page_obj = paginator_get_page(posts, request)
+    page_obj = paginator_get_page(group.posts.all(), request, FeedPaginator)
+    fragment, cursor = page_fragment(
+        request, 'posts:group_list_fragment', (slug,), page_obj
+    )
     context = {
         'group': group,
         'page_obj': page_obj,
+        'next_url': fragment.next_url(cursor),
+    }
+    response = render(request, 'posts/group_list.html', context)
+    fragment.warm_later(cursor)
+
+    return response
+
+
+def group_posts_fragment(request, slug):
+    """Порция ленты группы для бесконечной прокрутки"""
+    get_object_or_404(Group, slug=slug)
+    fragment = Fragment('posts:group_list_fragment', (slug,), request.user)
+
+    return fragment.response(request.GET.get('cursor'))
+
+
+def popular(request):
+    """Популярные посты всего сайта"""
+    context = {'page_obj': popular_page(request)}
+
+    return render(request, 'posts/popular.html', context)
+
+
+def group_popular(request, slug):
+    """Популярные посты группы"""
+    group = get_object_or_404(Group, slug=slug)
+    context = {
+        'group': group,
+        'page_obj': popular_page(request, group),
     }
 
-    return render(request, 'posts/group_list.html', context)
+    return render(request, 'posts/popular.html', context)
+
+
+def group_autocomplete(request):
+    """Подсказки групп для формы поста"""
+    return JsonResponse({'results': search_groups(request.GET.get('q', ''))})
 
 
 def profile(request, username):
     """Страница пользователя"""
     author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
-    page_obj = paginator_get_page(posts, request)
-    following = False
-    if request.user.is_authenticated:
-        following = Follow.objects.filter(
-            user=request.user,
-            author=author
-        ).exists()
+    page_obj = paginator_get_page(author.posts.all(), request, FeedPaginator)
+    following = is_following(request.user, author.pk)
+    fragment, cursor = page_fragment(
+        request, 'posts:profile_fragment', (username,), page_obj
+    )
     context = {
         'page_obj': page_obj,
         'author': author,
-        'following': following
+        'following': following,
+        'next_url': fragment.next_url(cursor),
+        'recommendations': recommended_authors(request.user),
+    }
+    response = render(request, 'posts/profile.html', context)
+    fragment.warm_later(cursor)
+
+    return response
+
+
+def profile_fragment(request, username):
+    """Порция постов пользователя для бесконечной прокрутки"""
+    get_object_or_404(User, username=username)
+    fragment = Fragment('posts:profile_fragment', (username,), request.user)
+
+    return fragment.response(request.GET.get('cursor'))
+
+
+def follow_list(request, username, kind):
+    """Страница подписчиков (kind='followers') или подписок ('following')"""
+    author = get_object_or_404(User, username=username)
+    try:
+        cursor = int(request.GET.get('cursor') or 0)
+    except ValueError:
+        raise Http404('Неверный курсор')
+    people, next_cursor = follow_page(author, kind, cursor)
+    relation = relations(request.user, people)
+    context = {
+        'author': author,
+        'kind': kind,
+        'rows': [(person, relation.get(person.pk)) for person in people],
+        'next_cursor': next_cursor,
     }
 
-    return render(request, 'posts/profile.html', context)
+    return render(request, 'posts/follow_list.html', context)
 
 
 def post_detail(request, post_id):
@@ -69,6 +153,7 @@ def post_detail(request, post_id):
 
 
 @login_required
+@throttle('post_create')
 def post_create(request):
     """Страница создания поста"""
     form = PostForm(request.POST or None, files=request.FILES or None)
@@ -108,6 +193,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@throttle('add_comment')
 def add_comment(request, post_id):
     """Комментирование поста"""
     post = get_object_or_404(Post, pk=post_id)
@@ -125,22 +211,44 @@ def add_comment(request, post_id):
 def follow_index(request):
     """Страница с постами авторов, на которых подписан пользователь"""
     posts = Post.objects.filter(author__following__user=request.user)
-    page_obj = paginator_get_page(posts, request)
+    page_obj = paginator_get_page(posts, request, FeedPaginator)
+    fragment, cursor = page_fragment(
+        request, 'posts:follow_index_fragment', (), page_obj
+    )
     context = {
         'page_obj': page_obj,
+        'next_url': fragment.next_url(cursor),
+        'recommendations': recommended_authors(request.user),
     }
+    response = render(request, 'posts/follow.html', context)
+    fragment.warm_later(cursor)
+
+    return response
+
+
+@never_cache
+def followed_authors(request):
+    """id авторов, на которых подписан читатель, для отметок в кэше страниц
+
+    Главная страница общая для всех читателей в cache_page, поэтому
+    отметки «вы подписаны» на ней проставляет скрипт по этому списку.
+    """
+    return JsonResponse({'ids': list(followed_ids(request.user))})
+
+
+@login_required
+def follow_index_fragment(request):
+    """Порция ленты подписок для бесконечной прокрутки"""
+    fragment = Fragment('posts:follow_index_fragment', (), request.user)
 
-    return render(request, 'posts/follow.html', context)
+    return fragment.response(request.GET.get('cursor'))
 
 
 @login_required
+@throttle('follow', methods=('GET', 'POST'))
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
-    if author != request.user and (
-            not Follow.objects.filter(
-                user=request.user,
-                author=author).exists()
-    ):
+    if author != request.user and not is_following(request.user, author.pk):
         Follow.objects.create(user=request.user, author=author)
         return redirect('posts:profile', username)
 
@@ -148,6 +256,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@throttle('follow', methods=('GET', 'POST'))
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     Follow.objects.filter(user=request.user, author=author).delete()
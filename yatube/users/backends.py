@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+
+def user_cache_key(user_id):
+    return f'user:{user_id}'
+
+
+def forget_users(user_ids):
+    """Сбрасывает кэш пользователей после queryset.update().
+
+    update() не посылает post_save: без этого, например, отключённый
+    пользователь остаётся вошедшим до истечения USER_CACHE_TIMEOUT.
+    """
+    cache.delete_many([user_cache_key(user_id) for user_id in user_ids])
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend, который берёт пользователя сессии из кэша.
+
+    Запись сбрасывается при каждом сохранении пользователя (смена пароля,
+    профиля, вход), см. users.signals; массовые изменения через update()
+    должны вызывать forget_users.
+    """
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, settings.USER_CACHE_TIMEOUT)
+
+        return user
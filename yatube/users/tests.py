@@ -0,0 +1,42 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from .backends import forget_users
+
+User = get_user_model()
+
+
+class CachedUserTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth', password='pass')
+
+    def setUp(self):
+        self.client.force_login(CachedUserTest.user)
+
+    def test_authenticated_request_without_queries(self):
+        """Сессия и пользователь берутся из кэша, без запросов к базе"""
+        self.client.get(reverse('about:author'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('about:author'))
+        self.assertEqual(response.context['user'], CachedUserTest.user)
+
+    def test_password_change_resets_cache(self):
+        """После смены пароля старая сессия больше не действует"""
+        self.client.get(reverse('about:author'))
+        user = User.objects.get(pk=CachedUserTest.user.pk)
+        user.set_password('new-pass')
+        user.save()
+        response = self.client.get(reverse('about:author'))
+        self.assertFalse(response.context['user'].is_authenticated)
+
+    def test_bulk_deactivation_resets_cache(self):
+        """После update(is_active=False) и forget_users сессия не действует"""
+        self.client.get(reverse('about:author'))
+        users = User.objects.filter(pk=CachedUserTest.user.pk)
+        users.update(is_active=False)
+        forget_users(users.values_list('pk', flat=True))
+        response = self.client.get(reverse('about:author'))
+        self.assertFalse(response.context['user'].is_authenticated)
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
@@ -29,11 +30,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.CompressionMiddleware',
+    'core.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.ProfilingMiddleware',
+    'core.middleware.MemoryProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -41,12 +47,23 @@ MIDDLEWARE = [
 ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+# Кэширующий загрузчик: шаблоны компилируются один раз на процесс
+# (core прогревает их при старте), а не на каждый запрос
+TEMPLATES_CACHED = os.getenv('TEMPLATES_CACHED', str(not DEBUG)) == 'True'
+if TEMPLATES_CACHED:
+    TEMPLATE_LOADERS = [
+        ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS),
+    ]
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': TEMPLATE_LOADERS,
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -93,18 +110,99 @@ USE_L10N = True
 USE_TZ = True
 
 STATIC_URL = '/static/'
+STATIC_ROOT = os.path.join(BASE_DIR, 'collected_static')
+# collectstatic добавляет хэш содержимого в имена и сжимает файлы;
+# при DEBUG статика отдаётся как есть из STATICFILES_DIRS
+STATIC_HASHED = os.getenv('STATIC_HASHED', str(not DEBUG)) == 'True'
+if STATIC_HASHED:
+    STATICFILES_STORAGE = 'core.storage.CompressedManifestStaticFilesStorage'
+
+# Путь бэкенда хранится в сессии: смена списка разлогинивает всех.
+# Пользователь сессии кэшируется; save() сбрасывает запись, а после
+# queryset.update() нужен users.backends.forget_users, иначе изменение
+# (например, is_active=False) видно только через USER_CACHE_TIMEOUT
+AUTHENTICATION_BACKENDS = ['users.backends.CachedModelBackend']
+USER_CACHE_TIMEOUT = int(os.getenv('USER_CACHE_TIMEOUT', 60))
+# Сессии читаются из кэша, а в базу пишутся сквозной записью
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
 
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 
-EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+# Письма ставятся в очередь, а отправляет их manage.py send_outbox
+# через OUTBOX_DELIVERY_BACKEND
+EMAIL_BACKEND = 'core.mail.OutboxEmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
+OUTBOX_DELIVERY_BACKEND = os.getenv(
+    'OUTBOX_DELIVERY_BACKEND',
+    'django.core.mail.backends.filebased.EmailBackend'
+)
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_MAX_ATTEMPTS = 5
+# Сколько секунд пачка писем закреплена за обработчиком: другие её не
+# берут, а после падения обработчика письма снова станут доступны
+OUTBOX_LEASE = int(os.getenv('OUTBOX_LEASE', 300))
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# '' — файлы отдаёт Django, 'x-accel-redirect' — nginx (internal-локация
+# MEDIA_ACCEL_REDIRECT_PREFIX смотрит в MEDIA_ROOT), 'x-sendfile' — Apache
+MEDIA_SENDFILE_BACKEND = os.getenv('MEDIA_SENDFILE_BACKEND', '')
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+# Картинки постов больше этой стороны уменьшаются при загрузке,
+# а больше POST_IMAGE_MAX_PIXELS пикселей — отклоняются
+POST_IMAGE_MAX_SIZE = 1920
+POST_IMAGE_MAX_PIXELS = 50_000_000
 
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
+
+# Лимиты на запись: запросов за период для пользователя и для IP
+THROTTLE_RATES = {
+    'post_create': {'user': '10/m', 'ip': '30/m'},
+    'add_comment': {'user': '20/m', 'ip': '60/m'},
+    'follow': {'user': '30/m', 'ip': '90/m'},
+}
+# Адреса обратных прокси (nginx), за которыми адрес клиента для лимитов
+# по IP берётся из X-Forwarded-For; без них за прокси лимит по IP —
+# общий на весь сайт
+THROTTLE_TRUSTED_PROXIES = [
+    address
+    for address in os.getenv('THROTTLE_TRUSTED_PROXIES', '').split(',')
+    if address
+]
+
+# Профили запросов: cprofile — точный, sampler — стек раз в интервал,
+# почти без накладных расходов.
+# PROFILE_SAMPLE_RATE — доля запросов, профилируемых без флага
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+PROFILE_MODE = os.getenv('PROFILE_MODE', 'sampler')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_SAMPLER_INTERVAL = 0.005
+# Профили памяти (tracemalloc) пишет отдельная middleware, она включается
+# MEMORY_PROFILING; MEMORY_SAMPLE_RATE — доля запросов без флага
+MEMORY_PROFILING = os.getenv('MEMORY_PROFILING', 'False') == 'True'
+MEMORY_SAMPLE_RATE = float(os.getenv('MEMORY_SAMPLE_RATE', '0'))
+MEMORY_TRACE_FRAMES = 10
+MEMORY_TOP_SITES = 25
+
+# Сжатие ответов: тела короче COMPRESSION_MIN_LENGTH не сжимаются,
+# сжатые тела хранятся в кэше по хэшу содержимого
+COMPRESSION_MIN_LENGTH = 200
+COMPRESSION_CACHE_TIMEOUT = 300
+COMPRESSION_MAX_RANDOM_BYTES = 100
+
+# Метрики Prometheus: каждый процесс сервера пишет счётчики в METRICS_DIR,
+# /metrics складывает их. Файлы умерших процессов удаляет старт сервера
+METRICS_DIR = os.getenv(
+    'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'yatube-metrics')
+)
+METRICS_FLUSH_INTERVAL = 5
+METRICS_ALLOWED_IPS = os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1').split(',')
+
+THUMBNAIL_KVSTORE = 'posts.thumbnails.LRUKVStore'
+THUMBNAIL_LRU_SIZE = 2000
+THUMBNAIL_LRU_TTL = 300
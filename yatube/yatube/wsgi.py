@@ -5,3 +5,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
 
 application = get_wsgi_application()
+
+# Только процессы сервера пишут метрики в METRICS_DIR
+from core import metrics  # noqa: E402
+
+metrics.registry.start()